@@ -1,61 +1,179 @@
 import librosa
 import numpy as np
+import soundfile as sf
 import os
-from config import N_FFT, HOP_LENGTH, HOP_LENGTH_HD
+from config import N_FFT, HOP_LENGTH, HOP_LENGTH_HD, STREAM_THRESHOLD_SECONDS, CACHE_ENABLED, SPECTROGRAM_DTYPE
+from audio.stft import stream_spectrogram_db, stft_magnitude, LoadCancelled
+from audio.cache import SpectrogramCache, hash_file
+from audio.compact import compact, as_db
 
 class AudioAnalyzer:
-    def __init__(self):
+    def __init__(self, cache=None, dtype=None):
         self.audio_data = None
         self.sr = None
-        self.S_db = None # this will hold the spectrogram data
+        self.S_db = None # this will hold the spectrogram data (float32 dB or uint8 levels)
+        self.dtype = dtype or SPECTROGRAM_DTYPE
+        self.hop_length = HOP_LENGTH
+        self.spectrograms = {} # hop length -> S_db, every resolution we have so far
+        self.file_path = None
+        self.n_samples = 0
+        self.streaming = False # True when we never decoded the whole file at once
+        self.progress = None # streaming progress callback and cancel Event of the current file
+        self.cancel = None
 
-    def load_file(self, file_path):
+        # on-disk spectrogram cache, so reopening a file skips the STFT
+        self.cache = cache
+        if self.cache is None and CACHE_ENABLED:
+            try:
+                self.cache = SpectrogramCache()
+            except OSError as e:
+                print(f"Cache Disabled: {e}")
+        self.content_hash = None
+
+    def load_file(self, file_path, streaming=None, high_res=False, progress=None, cancel=None):
         # load the audio file
+        # streaming=None picks the block by block mode for long files.
+        # progress(new_frames, decoded, total_samples, frames_done, total_frames)
+        # is called while the STFT runs, new_frames are the finished dB frames
+        # when streaming and None otherwise (those only get dB at the end).
+        # Setting the cancel Event stops the load
         try:
-            # load audio with original sample rate
-            self.audio_data, self.sr = librosa.load(file_path, sr=None)
-            
-            duration = len(self.audio_data) / self.sr
-            
+            self.file_path = file_path
+            self.audio_data = None
+            self.S_db = None
+            self.spectrograms = {}
+            self.progress = progress
+            self.cancel = cancel
+            if streaming is None:
+                streaming = self._should_stream(file_path)
+            self.streaming = streaming
+
+            # the cache key needs the content hash and the native sample rate
+            self.content_hash = hash_file(file_path) if self.cache else None
+            self.sr = librosa.get_samplerate(file_path)
+
             # calculate the spectrogram right away so its ready
-            self._compute_spectrogram()
-            
+            self.recompute_spectrogram(high_res=high_res)
+
+            duration = self.n_samples / self.sr
+
             filename = os.path.basename(file_path)
             return True, filename, self.sr, duration
+        except LoadCancelled:
+            self.file_path = None
+            self.S_db = None
+            self.spectrograms = {}
+            return False, "Cancelled", 0, 0
         except Exception as e:
             print(f"Analyzer Load Error: {e}")
             return False, str(e), 0, 0
+        finally:
+            # later resolution switches are not part of this load
+            self.progress = None
+            self.cancel = None
 
-    def _compute_spectrogram(self):
+    def _should_stream(self, file_path):
+        # long recordings would not fit in memory as one float array
+        try:
+            duration = sf.info(file_path).duration
+            return duration > STREAM_THRESHOLD_SECONDS
+        except Exception:
+            # soundfile cant read the header, let librosa deal with it
+            return False
+
+    def _ensure_audio(self):
+        # decode lazily, a cache hit never needs the samples
+        if self.audio_data is None and not self.streaming and self.file_path:
+            # load audio with original sample rate
+            self.audio_data, self.sr = librosa.load(self.file_path, sr=None)
+            self.n_samples = len(self.audio_data)
+        return self.audio_data
+
+    def has_audio(self):
+        return self.file_path is not None and self.S_db is not None
+
+    def _cache_key(self, hop_length):
+        key = self.cache.make_key(self.content_hash, N_FFT, hop_length, self.sr)
+        return f"{key}_{self.dtype}"
+
+    def _compute_spectrogram(self, hop_length=HOP_LENGTH):
         # this does the heavy math lifting
-        if self.audio_data is None:
-            return
+        if self.file_path is None:
+            return None
 
-        # STFT breaks the audio into frequencies
-        D = librosa.stft(self.audio_data, n_fft=N_FFT, hop_length=HOP_LENGTH)
-        
-        # convert to absolute values aka magnitude and then to decibels
-        # we use decibels cause human hearing is logarithmic
-        self.S_db = librosa.amplitude_to_db(np.abs(D), ref=np.max)
+        if self.cache:
+            S_db, meta = self.cache.get(self._cache_key(hop_length))
+            if S_db is not None:
+                self.n_samples = meta.get("n_samples", 0)
+                return S_db
+
+        if self.streaming:
+            # only the spectrogram is kept, the samples are read in blocks
+            S_db, self.sr, self.n_samples = stream_spectrogram_db(self.file_path, N_FFT, hop_length,
+                                                                   progress=self.progress, cancel=self.cancel)
+        else:
+            self._ensure_audio()
+
+            # STFT breaks the audio into frequencies (spread over all the cores)
+            # and we keep the absolute values aka magnitude
+            S = stft_magnitude(self.audio_data, N_FFT, hop_length,
+                               progress=self._segment_progress, cancel=self.cancel)
+
+            # convert to decibels
+            # we use decibels cause human hearing is logarithmic
+            S_db = librosa.amplitude_to_db(S, ref=np.max)
+
+        # float32 or uint8 levels, whichever storage was picked
+        S_db = compact(S_db, self.dtype)
+
+        if self.cache:
+            meta = {"sr": self.sr, "n_samples": self.n_samples}
+            S_db = self.cache.put(self._cache_key(hop_length), S_db, meta)
+
+        return S_db
+
+    def _segment_progress(self, frames_done, n_frames):
+        # direct load, the samples are all decoded already
+        if self.progress is not None:
+            self.progress(None, self.n_samples, self.n_samples, frames_done, n_frames)
+
+    def get_spectrogram(self, hop_length):
+        # hand back the spectrogram for a hop, computing only what we dont have
+        if hop_length in self.spectrograms:
+            return self.spectrograms[hop_length]
+
+        # a coarser hop that is a multiple of a finer one is just every n-th frame
+        # (centered frames line up exactly), so this is a view and not a new STFT.
+        # The dB values stay referenced to the finer matrix peak.
+        for fine_hop, S_fine in self.spectrograms.items():
+            if fine_hop < hop_length and hop_length % fine_hop == 0:
+                S_db = S_fine[:, ::hop_length // fine_hop]
+                break
+        else:
+            S_db = self._compute_spectrogram(hop_length)
+
+        self.spectrograms[hop_length] = S_db
+        return S_db
 
-    
     def recompute_spectrogram(self, high_res=False):
-        # recalculate the math with different resolution settings
-        if self.audio_data is None:
+        # switch between resolutions, the HD one is only computed when asked for
+        if self.file_path is None:
             return
 
         # choose the hop length based on the setting
         from config import HOP_LENGTH, HOP_LENGTH_HD
         target_hop = HOP_LENGTH_HD if high_res else HOP_LENGTH
-        
-        # run the STFT math again
-        D = librosa.stft(self.audio_data, n_fft=N_FFT, hop_length=target_hop)
-        self.S_db = librosa.amplitude_to_db(np.abs(D), ref=np.max)
-        
+
+        self.S_db = self.get_spectrogram(target_hop)
+        self.hop_length = target_hop
+
         return target_hop
 
     def get_spectrogram_data(self):
-        return self.S_db, self.sr
+        # always float dB, uint8 storage gets expanded here
+        if self.S_db is None:
+            return None, self.sr
+        return as_db(self.S_db), self.sr
 
     def get_audio_data(self):
-        return self.audio_data
\ No newline at end of file
+        return self._ensure_audio()
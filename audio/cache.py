@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from config import CACHE_DIR, CACHE_MAX_MB, AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_MB
+
+
+def hash_file(file_path, chunk_size=1 << 20):
+    # content hash, so a renamed or copied file still hits the cache
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    Folder of cache entries with a size cap.
+    Every entry is a group of files sharing the same key (key.npy, key.json...)
+    and the mtime of the main file is bumped on each hit, so evicting the
+    oldest mtime first gives LRU order.
+    """
+    suffix = ".bin"
+
+    def __init__(self, cache_dir=None, max_mb=None):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_bytes = int((max_mb if max_mb is not None else CACHE_MAX_MB) * 1024 * 1024)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for(self, key, suffix=None):
+        return os.path.join(self.cache_dir, key + (suffix or self.suffix))
+
+    def contains(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def touch(self, key):
+        # mark as recently used
+        try:
+            os.utime(self.path_for(key))
+        except OSError:
+            pass
+
+    def _atomic_write(self, path, write_fn):
+        # write next to the target and rename, readers never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write_fn(f)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def evict(self, keep=None):
+        # drop least recently used entries until we are under the cap
+        entries = {}
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                continue
+            key, ext = os.path.splitext(name)
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entry = entries.setdefault(key, {"size": 0, "atime": 0.0, "files": []})
+            entry["size"] += st.st_size
+            entry["files"].append(path)
+            if ext == self.suffix:
+                entry["atime"] = st.st_mtime
+
+        total = sum(e["size"] for e in entries.values())
+        for key, entry in sorted(entries.items(), key=lambda kv: kv[1]["atime"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in entry["files"]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= entry["size"]
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+
+class SpectrogramCache(DiskCache):
+    """
+    Spectrograms saved as .npy and opened memory-mapped, so a file we
+    already analysed loads in milliseconds instead of redoing the STFT.
+    """
+    suffix = ".npy"
+
+    def make_key(self, content_hash, n_fft, hop_length, sr):
+        return f"{content_hash}_{n_fft}_{hop_length}_{sr}"
+
+    def get(self, key):
+        # returns (S_db, meta) or (None, None) on a miss
+        if not self.contains(key):
+            return None, None
+        try:
+            S_db = np.load(self.path_for(key), mmap_mode="r")
+            with open(self.path_for(key, ".json"), "r") as f:
+                meta = json.load(f)
+            self.touch(key)
+            return S_db, meta
+        except Exception as e:
+            print(f"Cache Read Error: {e}")
+            return None, None
+
+    def put(self, key, S_db, meta=None):
+        # store and hand back the memory-mapped copy so the caller can drop its own
+        try:
+            self._atomic_write(self.path_for(key), lambda f: np.save(f, S_db))
+            payload = json.dumps(meta or {}).encode("utf-8")
+            self._atomic_write(self.path_for(key, ".json"), lambda f: f.write(payload))
+            self.evict(keep=key)
+            return np.load(self.path_for(key), mmap_mode="r")
+        except Exception as e:
+            print(f"Cache Write Error: {e}")
+            return S_db
+
+
+def hash_image(pil_image, *params):
+    # content hash of the pixels plus everything else that shapes the output
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{pil_image.mode}{pil_image.size}".encode("utf-8"))
+    h.update(pil_image.tobytes())
+    h.update(repr(params).encode("utf-8"))
+    return h.hexdigest()
+
+
+class AudioCache(DiskCache):
+    """
+    Generated WAVs keyed by hash_image of the source image and every
+    generation setting, so rendering the same picture again is a file copy.
+    Lives in a folder next to the spectrogram cache, not inside it, so
+    neither eviction ever sees the other's files.
+    """
+    suffix = ".wav"
+
+    def __init__(self, cache_dir=None, max_mb=None):
+        super().__init__(cache_dir or AUDIO_CACHE_DIR, max_mb if max_mb is not None else AUDIO_CACHE_MAX_MB)
+
+    def get(self, key, output_path):
+        # copy the cached wav to output_path, True on a hit. A copy and not a
+        # link, writing the output later must not change the cached file
+        if not self.contains(key):
+            return False
+        try:
+            shutil.copyfile(self.path_for(key), output_path)
+            self.touch(key)
+            return True
+        except OSError as e:
+            print(f"Cache Read Error: {e}")
+            return False
+
+    def put(self, key, wav_path):
+        try:
+            with open(wav_path, "rb") as src:
+                self._atomic_write(self.path_for(key), lambda f: shutil.copyfileobj(src, f))
+            self.evict(keep=key)
+        except OSError as e:
+            print(f"Cache Write Error: {e}")
@@ -0,0 +1,58 @@
+import numpy as np
+
+from config import SPECTROGRAM_DTYPE, DB_MIN, DB_MAX, STREAM_BLOCK_FRAMES
+
+# uint8 storage: DB_MIN..DB_MAX split into 256 equal bins, the same bins
+# a 256 entry colormap picks its colours from, so drawing is unchanged
+LEVELS = 256
+DB_STEP = (DB_MAX - DB_MIN) / LEVELS
+
+
+def _chunks(n_frames, chunk_frames):
+    for start in range(0, n_frames, chunk_frames):
+        yield slice(start, start + chunk_frames)
+
+
+def db_to_levels(S_db, out=None, chunk_frames=STREAM_BLOCK_FRAMES):
+    # quantize dB to 0..255, done in column chunks to keep the temporaries small
+    if out is None:
+        out = np.empty(S_db.shape, dtype=np.uint8)
+    for cols in _chunks(S_db.shape[1], chunk_frames):
+        norm = (np.asarray(S_db[:, cols], dtype=np.float32) - DB_MIN) / DB_STEP
+        np.floor(norm, out=norm)
+        np.clip(norm, 0, LEVELS - 1, out=norm)
+        out[:, cols] = norm
+    return out
+
+
+def levels_to_db(levels, out=None):
+    # back to float32 dB (centre of each bin), this is a copy
+    if out is None:
+        out = np.empty(levels.shape, dtype=np.float32)
+    np.multiply(levels, np.float32(DB_STEP), out=out)
+    out += np.float32(DB_MIN + DB_STEP / 2)
+    return out
+
+
+def compact(S_db, dtype=None):
+    # convert a freshly computed spectrogram to the storage format
+    dtype = dtype or SPECTROGRAM_DTYPE
+    if dtype == "uint8":
+        return db_to_levels(S_db)
+    if dtype == "float32":
+        return S_db.astype(np.float32, copy=False)
+    raise ValueError(f"Unknown spectrogram dtype: {dtype}")
+
+
+def as_db(S):
+    # float dB whatever the storage, float32 storage is returned as is (no copy)
+    if S.dtype == np.uint8:
+        return levels_to_db(S)
+    return S
+
+
+def as_levels(S):
+    # 0..255 levels whatever the storage, uint8 storage is returned as is (no copy)
+    if S.dtype == np.uint8:
+        return S
+    return db_to_levels(S)
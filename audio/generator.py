@@ -3,94 +3,415 @@ import soundfile as sf
 from PIL import Image
 import librosa
 
-from config import SAMPLE_RATE, N_FFT, HOP_LENGTH, OUTPUT_FILENAME
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SAMPLE_RATE, N_FFT, HOP_LENGTH, OUTPUT_FILENAME, PHASE_METHOD
+from config import GL_SEGMENT_FRAMES, GL_SEGMENT_OVERLAP, GL_SEGMENT_WORKERS
+from config import INCREMENTAL_MARGIN, INCREMENTAL_MAX_FRACTION, CACHE_ENABLED
+from config import GL_MOMENTUM, GL_TOLERANCE, PGHI_TOLERANCE
+from config import PREVIEW_SAMPLE_RATE, PREVIEW_N_FFT, PREVIEW_HOP_LENGTH, PREVIEW_ITERATIONS
+from audio.cache import AudioCache, hash_image
+from audio.phase import reconstruct, griffinlim
+from audio.stft import resolve_workers
+
+
+def settings_from_filename(file_path):
+    # exported spectrograms are named like name_44100Hz_3.8s.png, pick the settings back up
+    name = os.path.basename(file_path)
+    settings = {}
+    sr_match = re.search(r'_(\d+)Hz', name)
+    if sr_match:
+        settings["sample_rate"] = int(sr_match.group(1))
+    dur_match = re.search(r'_(\d+(?:\.\d+)?)s', name)
+    if dur_match:
+        settings["duration"] = float(dur_match.group(1))
+    return settings
+
 
 class AudioGenerator:
-    def generate_from_image(self, pil_image, duration_seconds=3.0, iterations=32, output_path=None, pitch_shift=0, sample_rate=None):
+    def __init__(self, cache=None):
+        # magnitude target and phase of the last render, the next render of
+        # the same settings starts from them and only redoes what changed
+        self.last_render = None
+
+        # finished wavs by image + settings, the same render twice is a copy
+        self.cache = cache
+        if self.cache is None and CACHE_ENABLED:
+            try:
+                self.cache = AudioCache()
+            except OSError as e:
+                print(f"Cache Disabled: {e}")
+
+    def image_to_spectrogram(self, pil_image, duration_seconds, sample_rate, pitch_shift=0, columns=None,
+                             n_fft=N_FFT, hop_length=HOP_LENGTH, band=1.0):
+        """
+        Image -> (1025, frames) float32 magnitude, everything before the phase
+        reconstruction. frames follows from the duration and sample rate.
+        columns=(f0, f1) gives only those frames of it, resized from just the
+        part of the image under them (long renders do it a segment at a time).
+        n_fft / hop_length / band are for the preview: a smaller STFT, and only
+        the bottom `band` of the image (what fits under a lower sample rate).
+        """
+        # We don't need Image.open() here because we received the image object directly
+        # Just ensure it is grayscale
+        original_img = pil_image.convert('L')
+        if band < 1.0:
+            top = int(round(original_img.height * (1.0 - band)))
+            original_img = original_img.crop((0, top, original_img.width, original_img.height))
+
+        # dimensions needed for audio math
+        frames_needed = int((duration_seconds * sample_rate) / hop_length)
+
+        # Height = Frequency Bins (1025 for n_fft=2048)
+        freq_bins = int(n_fft / 2) + 1
+
+        # Resize image to fit audio dimensions (BICUBIC is much smooth)
+        # Use LANCZOS here because it handles the "stretching" of long audio better than Bicubic
+        if columns is None:
+            print(f"Resizing internal image to: {frames_needed}x{freq_bins}")
+            resized_img = original_img.resize((frames_needed, freq_bins), Image.Resampling.LANCZOS)
+        else:
+            # crop with a margin of the LANCZOS support so the frames come out
+            # the same as in the full resize
+            f0, f1 = columns
+            scale = original_img.width / frames_needed
+            support = 3 * max(1.0, scale) + 2
+            lo = max(0, int(np.floor(f0 * scale - support)))
+            hi = min(original_img.width, int(np.ceil(f1 * scale + support)))
+            crop = original_img.crop((lo, 0, hi, original_img.height))
+            resized_img = crop.resize((f1 - f0, freq_bins), Image.Resampling.LANCZOS,
+                                      box=(f0 * scale - lo, 0, f1 * scale - lo, crop.height))
+
+        # then we flip the image
+        # Because in images; (0,0) is Top-Left and in Audio; (0,0) is Bottom-Left (Low Freq). 
+        # I was having issues with the audio being flipped.
+
+        resized_img = resized_img.transpose(Image.FLIP_TOP_BOTTOM)
+
+        #Convert pixels (0-255) to Audio Magnitude (0.0-1.0)so as to normalize the audio.
+        spectrogram = np.asarray(resized_img).astype(np.float32) / 255.0
+
+        # Apply Pitch Shift
+        if pitch_shift != 0:
+            # Convert semitones to frequency ratio: 2^(semitones/12)
+            pitch_ratio = 2 ** (pitch_shift / 12.0)
+
+            # Resize vertically (frequency axis)
+            # Shift UP = smaller height (compress), Shift DOWN = larger height (expand)
+            original_height = spectrogram.shape[0]
+            new_height = int(original_height / pitch_ratio)
+
+            # Resize using PIL for better quality
+            temp_img = Image.fromarray((spectrogram * 255).astype(np.uint8))
+            temp_img = temp_img.resize((spectrogram.shape[1], new_height), Image.Resampling.LANCZOS)
+            shifted = np.asarray(temp_img).astype(np.float32) / 255.0
+
+            # Crop or pad to original height
+            if new_height > original_height:
+                # Shifted down, crop from top
+                spectrogram = shifted[:original_height, :]
+            else:
+                # Shifted up, pad bottom with zeros
+                spectrogram = np.zeros((original_height, spectrogram.shape[1]), dtype=np.float32)
+                spectrogram[:new_height, :] = shifted
+
+        #Apply some contrast (Cube the values) why do we do this?
+         # This makes the black background truly silent and lines clearer
+        # Changed to 4 to remove the "blur" noise from stretching longer audio
+        spectrogram = np.power(spectrogram, 4) * 100
+
+        # a sine gives a peak proportional to n_fft, keep smaller STFTs as loud
+        if n_fft != N_FFT:
+            spectrogram *= n_fft / N_FFT
+
+        return spectrogram.astype(np.float32, copy=False)
+
+    def generate_preview(self, pil_image, duration_seconds=3.0, pitch_shift=0, sample_rate=None,
+                         iterations=PREVIEW_ITERATIONS):
+        """
+        Rough version of generate_from_image, quick enough to run after every
+        stroke: lower sample rate (only the part of the image below its
+        Nyquist), a small STFT and at most a couple of Griffin-Lim iterations
+        (0 = random phase and a single inverse STFT). Nothing is written or
+        cached, returns (audio, sample rate) for the player, (None, None) on errors.
+        """
+        try:
+            if sample_rate is None:
+                sample_rate = SAMPLE_RATE
+            preview_rate = min(sample_rate, PREVIEW_SAMPLE_RATE)
+
+            # the image rows stay on the same frequencies as in the full render
+            S = self.image_to_spectrogram(pil_image, duration_seconds, preview_rate, pitch_shift,
+                                          n_fft=PREVIEW_N_FFT, hop_length=PREVIEW_HOP_LENGTH,
+                                          band=preview_rate / sample_rate)
+
+            if iterations > 0:
+                audio, _, _ = griffinlim(S, iterations, PREVIEW_HOP_LENGTH, PREVIEW_N_FFT, tol=0)
+            else:
+                angles = np.exp(2j * np.pi * np.random.default_rng().random(S.shape)).astype(np.complex64)
+                audio = librosa.istft(S * angles, hop_length=PREVIEW_HOP_LENGTH, n_fft=PREVIEW_N_FFT)
+
+            # the wav export clips the same way
+            return np.clip(audio, -1.0, 1.0), preview_rate
+
+        except Exception as e:
+            print(f"Preview Error: {e}")
+
+            return None, None
+
+    def generate_from_image(self, pil_image, duration_seconds=3.0, iterations=32, output_path=None, pitch_shift=0, sample_rate=None,
+                            phase_method=None, dirty_columns=None):
         """
         Takes a PIL Image object directly (from the painter tab),
         converts it to audio, and saves it.
         pitch_shift: Semitones to shift pitch (-12 to +12)
         sample_rate: Target sample rate (uses config default if None)
+        phase_method: "griffinlim", "pghi" or "pghi+griffinlim" (config PHASE_METHOD if None)
+        dirty_columns: image x coordinates changed since the last call (from the
+        painter), None compares against the last render instead
+        Renders longer than two segments go through generate_segmented, and
+        repeated renders come straight from the audio cache. In both cases the
+        audio is only in the file and None is returned in its place.
         """
         # I am becoming obsessed with the try:except block
         try:
             if sample_rate is None:
                 sample_rate = SAMPLE_RATE
-            
-            print(f"--- Generating Audio ({duration_seconds}s) at {sample_rate}Hz ---")
-            
-            # We don't need Image.open() here because we received the image object directly
-            # Just ensure it is grayscale
-            original_img = pil_image.convert('L')
-            
-            # dimensions needed for audio math
-            frames_needed = int((duration_seconds * sample_rate) / HOP_LENGTH)
-            
-            # Height = Frequency Bins (1025 for n_fft=2048)
-            freq_bins = int(N_FFT / 2) + 1
-            
-            print(f"Resizing internal image to: {frames_needed}x{freq_bins}")
-            
-            # Resize image to fit audio dimensions (BICUBIC is much smooth)
-            # Use LANCZOS here because it handles the "stretching" of long audio better than Bicubic
-            resized_img = original_img.resize((frames_needed, freq_bins), Image.Resampling.LANCZOS)
-            
-            # then we flip the image
-            # Because in images; (0,0) is Top-Left and in Audio; (0,0) is Bottom-Left (Low Freq). 
-            # I was having issues with the audio being flipped.
+            target_file = output_path if output_path else OUTPUT_FILENAME
 
-            resized_img = resized_img.transpose(Image.FLIP_TOP_BOTTOM)
-            
-            #Convert pixels (0-255) to Audio Magnitude (0.0-1.0)so as to normalize the audio.
-            spectrogram = np.asarray(resized_img).astype(np.float32) / 255.0
+            key = None
+            if self.cache:
+                key = self.cache_key(pil_image, duration_seconds, iterations, pitch_shift, sample_rate, phase_method)
+                if self.cache.get(key, target_file):
+                    print(f"Cache hit! Copied to {target_file}")
+                    # the phase kept for incremental renders belongs to some other image now
+                    if self.last_render is not None and self.last_render.get("key") != key:
+                        self.last_render = None
+                    return target_file, None
+
+            if int((duration_seconds * sample_rate) / HOP_LENGTH) > 2 * GL_SEGMENT_FRAMES:
+                self.last_render = None
+                target_file = self.generate_segmented(pil_image, duration_seconds, iterations, output_path,
+                                                      pitch_shift, sample_rate, phase_method)
+                if key:
+                    self.cache.put(key, target_file)
+                return target_file, None
             
-            # Apply Pitch Shift
-            if pitch_shift != 0:
-                # Convert semitones to frequency ratio: 2^(semitones/12)
-                pitch_ratio = 2 ** (pitch_shift / 12.0)
-                
-                # Resize vertically (frequency axis)
-                # Shift UP = smaller height (compress), Shift DOWN = larger height (expand)
-                original_height = spectrogram.shape[0]
-                new_height = int(original_height / pitch_ratio)
-                
-                # Resize using PIL for better quality
-                temp_img = Image.fromarray((spectrogram * 255).astype(np.uint8))
-                temp_img = temp_img.resize((spectrogram.shape[1], new_height), Image.Resampling.LANCZOS)
-                shifted = np.asarray(temp_img).astype(np.float32) / 255.0
-                
-                # Crop or pad to original height
-                if new_height > original_height:
-                    # Shifted down, crop from top
-                    spectrogram = shifted[:original_height, :]
-                else:
-                    # Shifted up, pad bottom with zeros
-                    spectrogram = np.zeros((original_height, spectrogram.shape[1]), dtype=np.float32)
-                    spectrogram[:new_height, :] = shifted
+            print(f"--- Generating Audio ({duration_seconds}s) at {sample_rate}Hz ---")
             
-            #Apply some contrast (Cube the values) why do we do this?
-             # This makes the black background truly silent and lines clearer
-            # Changed to 4 to remove the "blur" noise from stretching longer audio
-            spectrogram = np.power(spectrogram, 4) * 100
+            spectrogram = self.image_to_spectrogram(pil_image, duration_seconds, sample_rate, pitch_shift)
 
             # We use Griffin-Lim Algorithm that was something I just encountered becuase of this audio generator project.
             # Converts Spectrogram (Frequency Map) -> Waveform (Audio)
-            print("Computing Inverse FFT (wait for it, or else!)...")
-            audio_signal = librosa.griffinlim(
-                spectrogram, 
-                n_iter=iterations, 
-                hop_length=HOP_LENGTH, 
-                n_fft=N_FFT
-            )
+            # fast Griffin-Lim (momentum) that stops once it stops improving,
+            # iterations from the Quality slider is the most it will run.
+            # PGHI guesses the phase in one go instead, see audio/phase.py
+            # A small edit of the last render only iterates on the columns it touched,
+            # any other setting (quality and phase method too) starts over
+            phase_method = phase_method or PHASE_METHOD
+            settings = (duration_seconds, sample_rate, pitch_shift, pil_image.size, iterations, phase_method)
+            angles = self.update_phase(spectrogram, settings, pil_image.width, dirty_columns, iterations)
+            if angles is not None:
+                audio_signal = librosa.istft(spectrogram * angles, hop_length=HOP_LENGTH, n_fft=N_FFT)
+            else:
+                print(f"Computing Inverse FFT with {phase_method} (wait for it, or else!)...")
+                audio_signal, used, convergence = reconstruct(
+                    spectrogram, 
+                    method=phase_method,
+                    n_iter=iterations, 
+                    hop_length=HOP_LENGTH, 
+                    n_fft=N_FFT
+                )
+                print(f"Ran {used}/{iterations} iterations (spectral convergence {float(convergence):.3f})")
+            self.remember_render(spectrogram, audio_signal, settings, key)
 
-            target_file = output_path if output_path else OUTPUT_FILENAME
             sf.write(target_file, audio_signal, sample_rate)
             print(f"Success! Saved to {target_file}")
+            if key:
+                self.cache.put(key, target_file)
             
             return target_file, audio_signal
             
         except Exception as e:
             print(f"Error: {e}")
 
-            return None, None
\ No newline at end of file
+            return None, None
+
+    def changed_frames(self, spectrogram, image_width, dirty_columns=None):
+        # bool per frame, True where the magnitude differs from the last render
+        if dirty_columns is None:
+            return np.any(spectrogram != self.last_render["S"], axis=0)
+
+        # each image column reaches the frames its LANCZOS support covers
+        frames = spectrogram.shape[1]
+        scale = frames / image_width
+        support = 3 * max(1.0, 1.0 / scale) + 1
+        changed = np.zeros(frames, dtype=bool)
+        for x in dirty_columns:
+            f0 = max(0, int(np.floor((x - support) * scale)))
+            f1 = min(frames, int(np.ceil((x + 1 + support) * scale)))
+            changed[f0:f1] = True
+        return changed
+
+    def update_phase(self, spectrogram, settings, image_width, dirty_columns=None, iterations=32):
+        """
+        Phase for spectrogram built from the last render's phase, or None when
+        there is nothing usable (first render, other settings, or most of it
+        changed). settings has to match the last render's exactly, it holds
+        everything besides the pixels that the phase depends on.
+        Every changed run of frames is iterated with Griffin-Lim from the
+        cached phase, together with INCREMENTAL_MARGIN frames around it, the
+        rest keeps the cached phase. Griffin-Lim also gets another margin on
+        the outside so the run's edges overlap-add with their neighbours like
+        in the full render, that outer margin is iterated too but thrown away.
+        """
+        last = self.last_render
+        if last is None or last["settings"] != settings or last["S"].shape != spectrogram.shape:
+            return None
+
+        changed = self.changed_frames(spectrogram, image_width, dirty_columns)
+        if changed.mean() > INCREMENTAL_MAX_FRACTION:
+            return None
+
+        angles = last["angles"].copy()
+        frames = spectrogram.shape[1]
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], changed.astype(np.int8), [0]])))
+        runs = list(zip(edges[0::2], edges[1::2]))
+        print(f"Reusing last phase, {int(changed.sum())}/{frames} frames changed in {len(runs)} runs")
+
+        for start, end in runs:
+            r0, r1 = max(0, start - INCREMENTAL_MARGIN), min(frames, end + INCREMENTAL_MARGIN)
+            c0, c1 = max(0, r0 - INCREMENTAL_MARGIN), min(frames, r1 + INCREMENTAL_MARGIN)
+            y, _, _ = griffinlim(spectrogram[:, c0:c1], iterations, HOP_LENGTH, N_FFT, angles=angles[:, c0:c1])
+            rebuilt = librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)[:, :c1 - c0]
+            angles[:, r0:r1] = (rebuilt / (np.abs(rebuilt) + 1e-16))[:, r0 - c0:r1 - c0]
+        return angles
+
+    def remember_render(self, spectrogram, audio_signal, settings, key=None):
+        # the phase of what was actually written, re-analysed so it is consistent
+        rebuilt = librosa.stft(audio_signal, n_fft=N_FFT, hop_length=HOP_LENGTH)[:, :spectrogram.shape[1]]
+        self.last_render = {
+            "S": spectrogram,
+            "angles": (rebuilt / (np.abs(rebuilt) + 1e-16)).astype(np.complex64),
+            "settings": settings,
+            "key": key,
+        }
+
+    def cache_key(self, pil_image, duration_seconds, iterations, pitch_shift, sample_rate, phase_method=None):
+        # the pixels plus every setting (and config value) the audio depends on
+        return hash_image(pil_image, duration_seconds, iterations, float(pitch_shift), sample_rate,
+                          phase_method or PHASE_METHOD, N_FFT, HOP_LENGTH, GL_MOMENTUM, GL_TOLERANCE,
+                          PGHI_TOLERANCE, GL_SEGMENT_FRAMES, GL_SEGMENT_OVERLAP)
+
+    def generate_batch(self, pil_images, duration_seconds=3.0, iterations=32, output_paths=None, pitch_shift=0, sample_rate=None,
+                       phase_method=None):
+        """
+        Same as generate_from_image for many images that share the settings.
+        They are stacked into one (batch, 1025, frames) float32 tensor and
+        Griffin-Lim runs on all of them in the same FFT calls, which saves a
+        lot of per call overhead on short clips.
+        Returns a (target_file, audio) pair per image, (None, None) on errors.
+        MemoryError is raised, not swallowed.
+        """
+        try:
+            if sample_rate is None:
+                sample_rate = SAMPLE_RATE
+
+            print(f"--- Generating {len(pil_images)} clips ({duration_seconds}s) at {sample_rate}Hz ---")
+
+            # every image resizes to the same frame count, so they stack
+            frames = int((duration_seconds * sample_rate) / HOP_LENGTH)
+            batch = np.empty((len(pil_images), N_FFT // 2 + 1, frames), dtype=np.float32)
+            for i, pil_image in enumerate(pil_images):
+                batch[i] = self.image_to_spectrogram(pil_image, duration_seconds, sample_rate, pitch_shift)
+
+            phase_method = phase_method or PHASE_METHOD
+            print(f"Computing Inverse FFT with {phase_method} for the whole batch...")
+            signals, used, _ = reconstruct(batch, method=phase_method, n_iter=iterations,
+                                           hop_length=HOP_LENGTH, n_fft=N_FFT)
+            print(f"Ran {used}/{iterations} iterations for the batch")
+
+            results = []
+            for i, audio_signal in enumerate(signals):
+                target_file = output_paths[i] if output_paths else f"{os.path.splitext(OUTPUT_FILENAME)[0]}_{i}.wav"
+                sf.write(target_file, audio_signal, sample_rate)
+                results.append((target_file, audio_signal))
+            print(f"Success! Saved {len(results)} files")
+
+            return results
+
+        except MemoryError:
+            raise # the caller decides, batch-synthesize reports it as over the memory cap
+        except Exception as e:
+            print(f"Error: {e}")
+
+            return [(None, None)] * len(pil_images)
+
+    def generate_segmented(self, pil_image, duration_seconds=3.0, iterations=32, output_path=None, pitch_shift=0,
+                           sample_rate=None, phase_method=None, segment_frames=GL_SEGMENT_FRAMES,
+                           overlap=GL_SEGMENT_OVERLAP, workers=GL_SEGMENT_WORKERS):
+        """
+        Long renders without holding the whole spectrogram. The frames are cut
+        into segments that reach `overlap` frames into their neighbours, every
+        segment is resized from its part of the image and reconstructed on its
+        own (several at once on a thread pool, the FFTs release the GIL), and
+        the finished audio is cross-faded over the middle of each overlap and
+        written to the file in order. Only a few segments are ever in memory.
+        Returns the output path.
+        """
+        if sample_rate is None:
+            sample_rate = SAMPLE_RATE
+        phase_method = phase_method or PHASE_METHOD
+
+        image = pil_image.convert('L')
+        frames = int((duration_seconds * sample_rate) / HOP_LENGTH)
+        bounds = [(a, min(a + segment_frames, frames)) for a in range(0, frames, segment_frames)]
+        if len(bounds) > 1 and bounds[-1][1] - bounds[-1][0] < overlap:
+            # a last bit shorter than the overlap joins the segment before it
+            bounds[-2:] = [(bounds[-2][0], frames)]
+        print(f"--- Generating Audio ({duration_seconds}s) at {sample_rate}Hz in {len(bounds)} segments ---")
+
+        def render(core):
+            f0 = max(0, core[0] - overlap)
+            f1 = min(frames, core[1] + overlap)
+            S = self.image_to_spectrogram(image, duration_seconds, sample_rate, pitch_shift, columns=(f0, f1))
+            y, _, _ = reconstruct(S, method=phase_method, n_iter=iterations, hop_length=HOP_LENGTH, n_fft=N_FFT)
+            return f0 * HOP_LENGTH, y
+
+        # equal power fade, the segments phases are unrelated so their energies add
+        half = overlap // 2 * HOP_LENGTH
+        t = (np.arange(2 * half) + 0.5) / (2 * half)
+        fade_in = np.sin(0.5 * np.pi * t).astype(np.float32)
+        fade_out = np.cos(0.5 * np.pi * t).astype(np.float32)
+
+        target_file = output_path if output_path else OUTPUT_FILENAME
+        workers = resolve_workers(workers)
+        with sf.SoundFile(target_file, 'w', samplerate=sample_rate, channels=1) as out, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = []
+            queued = 0
+            tail = None
+            for k in range(len(bounds)):
+                # keep a few segments ahead, not all of them
+                while queued < len(bounds) and queued <= k + workers:
+                    pending.append(pool.submit(render, bounds[queued]))
+                    queued += 1
+                start, y = pending.pop(0).result()
+
+                own_from = 0 if k == 0 else bounds[k][0] * HOP_LENGTH + half
+                own_to = (frames - 1) * HOP_LENGTH if k == len(bounds) - 1 else bounds[k][1] * HOP_LENGTH - half
+
+                if tail is not None:
+                    fade_from = bounds[k][0] * HOP_LENGTH - half
+                    head = y[fade_from - start:fade_from - start + 2 * half]
+                    out.write(tail * fade_out + head * fade_in)
+                out.write(y[own_from - start:own_to - start])
+
+                if k < len(bounds) - 1:
+                    tail = y[own_to - start:own_to - start + 2 * half].copy()
+                print(f"Segment {k + 1}/{len(bounds)} written")
+
+        print(f"Success! Saved to {target_file}")
+        return target_file
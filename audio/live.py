@@ -0,0 +1,238 @@
+import threading
+import time
+
+import numpy as np
+import sounddevice as sd
+
+from config import SAMPLE_RATE, N_FFT, LIVE_SAMPLE_RATE, LIVE_N_FFT, LIVE_HOP_LENGTH, LIVE_BLOCKSIZE, LIVE_LEAD_BLOCKS
+
+
+class RingBuffer:
+    """
+    Fixed size float32 sample queue between the synthesis thread and the
+    audio callback. The lock is only held for the copies.
+    """
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def available(self):
+        return self.size
+
+    def free(self):
+        return self.capacity - self.size
+
+    def write(self, samples):
+        with self.lock:
+            n = min(len(samples), self.capacity - self.size)
+            end = (self.start + self.size) % self.capacity
+            first = min(n, self.capacity - end)
+            self.data[end:end + first] = samples[:first]
+            self.data[:n - first] = samples[first:n]
+            self.size += n
+            return n
+
+    def read_into(self, out):
+        # fills out as far as possible, returns how many samples it got
+        with self.lock:
+            n = min(len(out), self.size)
+            first = min(n, self.capacity - self.start)
+            out[:first] = self.data[self.start:self.start + first]
+            out[first:n] = self.data[:n - first]
+            self.start = (self.start + n) % self.capacity
+            self.size -= n
+            return n
+
+    def clear(self):
+        with self.lock:
+            self.start = 0
+            self.size = 0
+
+
+class ColumnSynth:
+    """
+    Turns image columns into audio a block of STFT frames at a time. Every
+    bin keeps its phase from the previous frame and advances it by one
+    hop at the bin's own frequency, so steady pixels give steady tones.
+    The frames of a block go through one vectorised irfft and are
+    overlap-added onto the tail of the previous block.
+    Only the bottom `band` of the image is played, the part that fits
+    under the live Nyquist (same as the preview in generate_preview).
+    """
+    def __init__(self, n_fft=LIVE_N_FFT, hop_length=LIVE_HOP_LENGTH, pitch_shift=0, band=1.0, rng=None):
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_bins = n_fft // 2 + 1
+
+        rng = rng if rng is not None else np.random.default_rng()
+        # random start phase, all zeros would begin with a click
+        self.phase = 2 * np.pi * rng.random(self.n_bins)
+        self.advance = 2 * np.pi * np.arange(self.n_bins) * hop_length / n_fft
+
+        self.window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+        # same normalisation as istft, a constant for a hann window at n_fft / 4 hops
+        squares = np.zeros(n_fft + hop_length * 4)
+        for i in range(0, len(squares) - n_fft + 1, hop_length):
+            squares[i:i + n_fft] += self.window ** 2
+        self.norm = float(squares[n_fft:n_fft + hop_length].mean())
+        self.tail = np.zeros(n_fft - hop_length, dtype=np.float32)
+
+        # pitch shift reads every bin from a lower/higher source bin
+        ratio = 2 ** (pitch_shift / 12.0)
+        self.source_bin = np.arange(self.n_bins) / ratio
+        self.band = band
+        # a sine peak grows with n_fft, keep the generator's loudness
+        self.gain = 100 * n_fft / N_FFT
+
+    def magnitudes(self, columns):
+        # (height, frames) uint8 pixels -> (bins, frames), bottom row = 0 Hz,
+        # top row the Nyquist of the full render
+        height = columns.shape[0]
+        fraction = self.source_bin / (self.n_bins - 1) * self.band
+        rows = np.round((1 - fraction) * (height - 1)).astype(np.intp)
+        inside = rows >= 0
+        mags = np.zeros((self.n_bins, columns.shape[1]), dtype=np.float32)
+        mags[inside] = (columns[rows[inside]] / 255.0) ** 4 * self.gain
+        return mags
+
+    def synthesize(self, columns):
+        # one frame per column, returns frames * hop_length samples
+        n_frames = columns.shape[1]
+        mags = self.magnitudes(columns)
+
+        steps = np.arange(1, n_frames + 1)
+        phases = self.phase[:, None] + self.advance[:, None] * steps
+        self.phase = phases[:, -1] % (2 * np.pi)
+
+        frames = np.fft.irfft(mags * np.exp(1j * phases), n=self.n_fft, axis=0).T
+        frames *= self.window / self.norm
+
+        out = np.zeros(n_frames * self.hop_length + len(self.tail), dtype=np.float32)
+        out[:len(self.tail)] = self.tail
+        for i, frame in enumerate(frames):
+            start = i * self.hop_length
+            out[start:start + self.n_fft] += frame
+
+        block = out[:n_frames * self.hop_length]
+        self.tail = out[n_frames * self.hop_length:].copy()
+        return np.clip(block, -1.0, 1.0)
+
+
+class LiveEngine:
+    """
+    Live sonification: a playhead loops over the image every `duration`
+    seconds and the columns under it are synthesised just before they are
+    played. A worker thread keeps lead_blocks blocks ready in a ring
+    buffer and the sounddevice callback only copies out of it. A stroke is
+    heard after those blocks plus the device's own buffer, with the default
+    of one block that is about one buffer period.
+    get_image is called for every block, it returns the current PIL image.
+    sample_rate is the rate of the full render, so the image rows keep the
+    frequencies they get in GENERATE. Playback runs at LIVE_SAMPLE_RATE
+    at most and leaves out the part of the image above its Nyquist.
+
+    stats:
+      callbacks   audio callbacks so far
+      underruns   callbacks that found the ring buffer short (filled with silence)
+      xruns       output underflows reported by the audio driver
+      late        blocks whose synthesis took longer than the block lasts
+      synth_ms    slowest block synthesis, budget_ms is the block length
+    """
+    def __init__(self, get_image, duration, sample_rate=SAMPLE_RATE, pitch_shift=0,
+                 n_fft=LIVE_N_FFT, hop_length=LIVE_HOP_LENGTH, blocksize=LIVE_BLOCKSIZE,
+                 lead_blocks=LIVE_LEAD_BLOCKS):
+        self.get_image = get_image
+        self.duration = duration
+        self.sample_rate = min(sample_rate, LIVE_SAMPLE_RATE) # what the sound card gets
+        self.hop_length = hop_length
+        # blocks are whole frames
+        self.blocksize = max(hop_length, blocksize - blocksize % hop_length)
+        self.lead = self.blocksize * lead_blocks
+
+        self.synth = ColumnSynth(n_fft, hop_length, pitch_shift, band=self.sample_rate / sample_rate)
+        self.ring = RingBuffer(self.lead + self.blocksize)
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+        self.stream = None
+
+        self.next_frame = 0 # first frame of the next block to synthesise
+        self.played = 0 # samples handed to the sound card
+        self.stats = {"callbacks": 0, "underruns": 0, "xruns": 0, "late": 0,
+                      "synth_ms": 0.0, "budget_ms": 1000.0 * self.blocksize / self.sample_rate}
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.ring.clear()
+        self.fill() # something ready before the first callback
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.stream = sd.OutputStream(samplerate=self.sample_rate, blocksize=self.blocksize, channels=1,
+                                      dtype="float32", callback=self.callback)
+        self.stream.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def playhead(self):
+        # 0..1 position of what is being heard right now
+        return (self.played / self.sample_rate / self.duration) % 1.0
+
+    def columns_for(self, image, n_frames):
+        # image columns under the next n_frames frames, (height, n_frames) uint8
+        frames = self.next_frame + np.arange(n_frames)
+        seconds = frames * self.hop_length / self.sample_rate
+        x = ((seconds / self.duration) % 1.0 * image.width).astype(np.intp)
+        x = np.minimum(x, image.width - 1)
+
+        # only the few columns under the playhead are copied out of the image
+        x0, x1 = int(x.min()), int(x.max()) + 1
+        strip = np.asarray(image.crop((x0, 0, x1, image.height)).convert("L"))
+        return strip[:, x - x0]
+
+    def fill(self):
+        # synthesise blocks until the lead is there
+        while self.running and self.ring.available() < self.lead:
+            start = time.perf_counter()
+            n_frames = self.blocksize // self.hop_length
+            block = self.synth.synthesize(self.columns_for(self.get_image(), n_frames))
+            self.next_frame += n_frames
+            self.ring.write(block)
+
+            took = 1000.0 * (time.perf_counter() - start)
+            self.stats["synth_ms"] = max(self.stats["synth_ms"], took)
+            if took > self.stats["budget_ms"]:
+                self.stats["late"] += 1
+
+    def run(self):
+        while self.running:
+            self.wake.wait(timeout=self.stats["budget_ms"] / 1000.0)
+            self.wake.clear()
+            self.fill()
+
+    def callback(self, outdata, frames, time_info, status):
+        # audio thread, only copies, synthesis happens in run()
+        self.stats["callbacks"] += 1
+        if status.output_underflow:
+            self.stats["xruns"] += 1
+
+        out = outdata[:, 0]
+        got = self.ring.read_into(out)
+        if got < frames:
+            out[got:] = 0.0
+            self.stats["underruns"] += 1
+        self.played += frames
+        self.wake.set()
@@ -0,0 +1,190 @@
+import heapq
+
+import numpy as np
+import librosa
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None # PGHI falls back to the pure python loop, same result but a lot slower
+
+from config import N_FFT, HOP_LENGTH, GL_MOMENTUM, GL_TOLERANCE, PGHI_TOLERANCE
+
+# keeps the phase normalisation away from 0/0
+EPS = 1e-16
+
+# what reconstruct accepts
+PHASE_METHODS = ("griffinlim", "pghi", "pghi+griffinlim")
+
+# time-frequency spread of the gaussian that best matches a hann window of
+# length n_fft is lambda = PGHI_GAMMA * n_fft ** 2 (Prusa et al.)
+PGHI_GAMMA = 0.25645
+
+
+def spectral_convergence(S, rebuilt):
+    # ||S - |X||| / ||S|| per item of the batch, 0 means the magnitudes match exactly
+    axes = (-2, -1)
+    error = np.sqrt(np.sum((S - np.abs(rebuilt)) ** 2, axis=axes))
+    return error / np.maximum(np.sqrt(np.sum(S ** 2, axis=axes)), EPS)
+
+
+def griffinlim(S, n_iter=32, hop_length=HOP_LENGTH, n_fft=N_FFT, momentum=GL_MOMENTUM,
+               tol=GL_TOLERANCE, angles=None, length=None, rng=None):
+    """
+    Fast Griffin-Lim (the momentum variant, like librosa.griffinlim) that
+    stops early. After every iteration the spectral convergence between S
+    and the re-analysed magnitude is measured, once it improves by less
+    than tol (relative) the loop ends, n_iter is only the upper bound.
+    tol=0 always runs all n_iter.
+    S can be (1025, frames) or a stacked (batch, 1025, frames).
+    angles is an optional starting phase (unit complex, same shape as S),
+    random otherwise.
+    Returns (waveform, iterations run, final spectral convergence)
+    """
+    S = np.asarray(S, dtype=np.float32)
+    if angles is None:
+        rng = rng if rng is not None else np.random.default_rng()
+        angles = np.exp(2j * np.pi * rng.random(S.shape)).astype(np.complex64)
+    else:
+        angles = np.array(angles, dtype=np.complex64)
+
+    rebuilt = np.zeros_like(angles)
+    previous = None
+    convergence = None
+    iterations = 0
+
+    for iterations in range(1, n_iter + 1):
+        last = rebuilt
+        inverse = librosa.istft(S * angles, hop_length=hop_length, n_fft=n_fft, length=length)
+        rebuilt = librosa.stft(inverse, n_fft=n_fft, hop_length=hop_length)
+
+        # momentum step, then back to unit magnitude
+        angles[:] = rebuilt - (momentum / (1 + momentum)) * last
+        angles /= np.abs(angles) + EPS
+
+        # the batch keeps going until every item has settled
+        convergence = spectral_convergence(S, rebuilt)
+        if tol > 0 and previous is not None:
+            improvement = (previous - convergence) / np.maximum(previous, EPS)
+            if np.all(improvement < tol):
+                break
+        previous = convergence
+
+    y = librosa.istft(S * angles, hop_length=hop_length, n_fft=n_fft, length=length)
+    return y, iterations, convergence
+
+
+def phase_gradients(S, hop_length=HOP_LENGTH, n_fft=N_FFT):
+    """
+    Phase derivatives of a (bins, frames) magnitude, read off the log
+    magnitude like a gaussian window STFT would have them.
+      time_grad  phase advance from one frame to the next
+      freq_grad  phase change from one bin to the next
+    Both in radians and in librosa's convention (phase measured from the
+    start of every frame, frames centered).
+    """
+    lam = PGHI_GAMMA * n_fft ** 2
+    log_mag = np.log(np.maximum(S, EPS)).astype(np.float64)
+
+    # d/dbin of the log magnitude gives how far each bin sits from the
+    # instantaneous frequency, plus the bin's own advance over a hop
+    bins = np.arange(S.shape[0])[:, None]
+    time_grad = (hop_length * n_fft / lam) * np.gradient(log_mag, axis=0) + 2 * np.pi * hop_length * bins / n_fft
+
+    # d/dframe of the log magnitude gives the group delay, the -pi is the
+    # alternating sign a centered frame has between neighbouring bins
+    freq_grad = -(lam / (hop_length * n_fft)) * np.gradient(log_mag, axis=1) - np.pi
+    return time_grad, freq_grad
+
+
+def _integrate_heap(mag, time_grad, freq_grad, floor, phase, done):
+    # spreads the phase out from the loudest bins, always continuing from the
+    # loudest bin already done, so the estimate follows the ridges
+    n_bins, n_frames = mag.shape
+    heap = [(0.0, 0, 0)]
+    heap.pop()
+
+    # stable sort, so equal bins start in the same order with and without numba
+    order = np.argsort(mag.ravel(), kind="mergesort")[::-1]
+    for start in order:
+        k0, n0 = start // n_frames, start % n_frames
+        if done[k0, n0]:
+            continue
+        if mag[k0, n0] < floor:
+            break
+
+        # a new island, its phase is arbitrary
+        phase[k0, n0] = 0.0
+        done[k0, n0] = True
+        heapq.heappush(heap, (-mag[k0, n0], k0, n0))
+
+        while len(heap) > 0:
+            _, k, n = heapq.heappop(heap)
+            if n + 1 < n_frames and not done[k, n + 1] and mag[k, n + 1] >= floor:
+                phase[k, n + 1] = phase[k, n] + (time_grad[k, n] + time_grad[k, n + 1]) / 2
+                done[k, n + 1] = True
+                heapq.heappush(heap, (-mag[k, n + 1], k, n + 1))
+            if n > 0 and not done[k, n - 1] and mag[k, n - 1] >= floor:
+                phase[k, n - 1] = phase[k, n] - (time_grad[k, n] + time_grad[k, n - 1]) / 2
+                done[k, n - 1] = True
+                heapq.heappush(heap, (-mag[k, n - 1], k, n - 1))
+            if k + 1 < n_bins and not done[k + 1, n] and mag[k + 1, n] >= floor:
+                phase[k + 1, n] = phase[k, n] + (freq_grad[k, n] + freq_grad[k + 1, n]) / 2
+                done[k + 1, n] = True
+                heapq.heappush(heap, (-mag[k + 1, n], k + 1, n))
+            if k > 0 and not done[k - 1, n] and mag[k - 1, n] >= floor:
+                phase[k - 1, n] = phase[k, n] - (freq_grad[k, n] + freq_grad[k - 1, n]) / 2
+                done[k - 1, n] = True
+                heapq.heappush(heap, (-mag[k - 1, n], k - 1, n))
+
+
+# the same loop compiled, None without numba
+_integrate_heap_numba = njit(cache=True)(_integrate_heap) if njit is not None else None
+
+
+def pghi_phase(S, hop_length=HOP_LENGTH, n_fft=N_FFT, tol=PGHI_TOLERANCE, rng=None):
+    """
+    Phase gradient heap integration: a phase estimate for the magnitude S in
+    one pass, no iterations. Bins quieter than tol * max get a random phase,
+    they are too quiet for their gradients to mean anything.
+    S can be (1025, frames) or a stacked (batch, 1025, frames).
+    Returns unit complex angles shaped like S.
+    """
+    S = np.asarray(S, dtype=np.float32)
+    if S.ndim == 3:
+        return np.stack([pghi_phase(item, hop_length, n_fft, tol, rng) for item in S])
+
+    rng = rng if rng is not None else np.random.default_rng()
+    time_grad, freq_grad = phase_gradients(S, hop_length, n_fft)
+
+    phase = 2 * np.pi * rng.random(S.shape)
+    done = np.zeros(S.shape, dtype=np.bool_)
+    floor = float(S.max()) * tol
+    if floor > 0:
+        integrate = _integrate_heap_numba or _integrate_heap
+        integrate(S.astype(np.float64), time_grad, freq_grad, floor, phase, done)
+    return np.exp(1j * phase).astype(np.complex64)
+
+
+def reconstruct(S, method="griffinlim", n_iter=32, hop_length=HOP_LENGTH, n_fft=N_FFT, length=None, rng=None):
+    """
+    Magnitude -> waveform with the chosen phase backend
+      "griffinlim"       fast Griffin-Lim from a random phase, up to n_iter iterations
+      "pghi"             phase gradient heap integration and a single inverse STFT
+      "pghi+griffinlim"  PGHI as the starting phase of Griffin-Lim, a few
+                         iterations are usually enough from there
+    Returns (waveform, iterations run, final spectral convergence)
+    """
+    if method not in PHASE_METHODS:
+        raise ValueError(f"Unknown phase method: {method}")
+    if method == "griffinlim":
+        return griffinlim(S, n_iter, hop_length, n_fft, length=length, rng=rng)
+
+    angles = pghi_phase(S, hop_length, n_fft, rng=rng)
+    if method == "pghi+griffinlim":
+        return griffinlim(S, n_iter, hop_length, n_fft, angles=angles, length=length)
+
+    S = np.asarray(S, dtype=np.float32)
+    y = librosa.istft(S * angles, hop_length=hop_length, n_fft=n_fft, length=length)
+    rebuilt = librosa.stft(y, n_fft=n_fft, hop_length=hop_length)[..., :S.shape[-1]]
+    return y, 0, spectral_convergence(S, rebuilt)
@@ -41,5 +41,12 @@ class AudioPlayer:
         except Exception as e:
             print(f"SoundDevice Error: {e}")
 
+    def play_preview(self, audio_data, sample_rate):
+        # straight from memory and without waiting, a new preview cuts off the old one
+        try:
+            sd.play(audio_data, sample_rate)
+        except Exception as e:
+            print(f"SoundDevice Error: {e}")
+
     def stop_array(self):
         sd.stop()
\ No newline at end of file
@@ -0,0 +1,217 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+import librosa
+
+from config import STREAM_BLOCK_FRAMES, STFT_WORKERS, PARALLEL_MIN_FRAMES
+
+# same floor librosa.amplitude_to_db uses
+AMIN = 1e-5
+TOP_DB = 80.0
+
+
+def frame_count(n_samples, hop_length):
+    # number of frames a centered librosa.stft gives for n_samples
+    return 1 + n_samples // hop_length
+
+
+def resolve_workers(workers=None):
+    # 0 or None means one worker per core
+    if workers is None:
+        workers = STFT_WORKERS
+    if not workers or workers < 1:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+def _segment(y, f0, f1, n_fft, hop_length, center):
+    # samples needed for frames f0..f1, only the file edges get copied for padding
+    pad = n_fft // 2 if center else 0
+    a = f0 * hop_length - pad
+    b = (f1 - 1) * hop_length + n_fft - pad
+    seg = y[max(a, 0):min(b, len(y))]
+    if a < 0 or b > len(y):
+        seg = np.pad(seg, (max(0, -a), max(0, b - len(y))))
+    return seg
+
+
+def stft_magnitude(y, n_fft, hop_length, center=True, workers=None, out=None, progress=None, cancel=None):
+    """
+    abs(librosa.stft(y)) computed over overlapping frame segments on a
+    thread pool. The FFTs release the GIL, so the threads really run in
+    parallel and all of them read the same y and write into the same
+    output matrix, nothing gets copied or pickled between workers.
+    Short signals run serial since the pool would only add overhead, with
+    one worker the segments run one after the other.
+    progress(frames_done, n_frames) is called after every segment (from
+    the worker threads), setting the cancel Event raises LoadCancelled.
+    """
+    if center:
+        n_frames = frame_count(len(y), hop_length)
+    else:
+        n_frames = 1 + (len(y) - n_fft) // hop_length
+
+    if out is None:
+        out = np.empty((1 + n_fft // 2, n_frames), dtype=np.float32)
+
+    workers = resolve_workers(workers)
+    if n_frames < PARALLEL_MIN_FRAMES:
+        segments = [(0, n_frames)]
+    else:
+        # a few segments per worker so a slow one doesnt hold everyone up
+        step = -(-n_frames // (workers * 4))
+        step = max(step, PARALLEL_MIN_FRAMES // 4)
+        segments = [(f0, min(f0 + step, n_frames)) for f0 in range(0, n_frames, step)]
+
+    done = [0]
+    done_lock = threading.Lock()
+
+    def run(bounds):
+        f0, f1 = bounds
+        if cancel is not None and cancel.is_set():
+            raise LoadCancelled()
+        seg = _segment(y, f0, f1, n_fft, hop_length, center)
+        D = librosa.stft(seg, n_fft=n_fft, hop_length=hop_length, center=False)
+        np.abs(D, out=out[:, f0:f1])
+        if progress is not None:
+            with done_lock:
+                done[0] += f1 - f0
+                progress(done[0], n_frames)
+
+    if len(segments) == 1 or workers == 1:
+        for bounds in segments:
+            run(bounds)
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(segments))) as pool:
+            # list() so worker errors are raised here
+            list(pool.map(run, segments))
+
+    return out
+
+
+def iter_magnitude_blocks(f, n_fft, hop_length, block_frames=STREAM_BLOCK_FRAMES):
+    """
+    Reads an open SoundFile block by block and yields
+    (magnitude frames, samples decoded so far). The frames match
+    librosa.stft(center=True) on the whole file, the block edges keep the
+    last n_fft - hop samples so no frame is lost.
+    """
+    # centered stft = zero padding of n_fft // 2 on both ends
+    pad = n_fft // 2
+    carry = np.zeros(pad, dtype=np.float32)
+    decoded = 0
+
+    # half a window more than block_frames hops, so with the carry every block
+    # (the first one too) gives at least block_frames frames
+    blocksize = hop_length * block_frames + pad
+    for block in f.blocks(blocksize=blocksize, dtype='float32', always_2d=True):
+        # librosa.load averages the channels, do the same
+        mono = block.mean(axis=1, dtype=np.float32)
+        decoded += len(mono)
+        mag, carry = _full_frames(np.concatenate([carry, mono]), n_fft, hop_length)
+        if mag is not None:
+            yield mag, decoded
+
+    tail = np.concatenate([carry, np.zeros(pad, dtype=np.float32)])
+    mag, _ = _full_frames(tail, n_fft, hop_length)
+    if mag is not None:
+        yield mag, decoded
+
+
+def _full_frames(buf, n_fft, hop_length):
+    # every full frame in buf, plus the samples to carry into the next block
+    if len(buf) < n_fft:
+        return None, buf
+
+    n = 1 + (len(buf) - n_fft) // hop_length
+    used = (n - 1) * hop_length + n_fft
+    mag = stft_magnitude(buf[:used], n_fft, hop_length, center=False)
+    return mag, buf[n * hop_length:]
+
+
+def _append_frames(S, pos, mag):
+    # write mag into S at pos, the header frame count is only an estimate
+    # for some formats so we grow if needed
+    n = mag.shape[1]
+    if pos + n > S.shape[1]:
+        grow = np.empty((S.shape[0], pos + n - S.shape[1]), dtype=S.dtype)
+        S = np.concatenate([S, grow], axis=1)
+    S[:, pos:pos + n] = mag
+    return S, pos + n
+
+
+def _empty_spectrogram(f, n_fft, hop_length):
+    return np.empty((1 + n_fft // 2, frame_count(f.frames, hop_length)), dtype=np.float32)
+
+
+def _to_db_inplace(view, offset, amin=AMIN):
+    # 20 * log10(max(amin, S)) - offset, written back into the view
+    np.maximum(view, amin, out=view)
+    np.log10(view, out=view)
+    view *= 20.0
+    view -= offset
+
+
+def stream_spectrogram_db(file_path, n_fft, hop_length, block_frames=STREAM_BLOCK_FRAMES,
+                          progress=None, cancel=None):
+    """
+    Streaming version of amplitude_to_db(abs(stft(y)), ref=np.max).
+    Every block goes to dB right away against the peak seen so far, so the
+    frames done are already a usable spectrogram while the rest loads.
+    At the end each block is shifted by how much the peak grew after it
+    and the top_db floor is applied, which gives the same numbers as the
+    one shot version.
+
+    progress(new_frames, samples_decoded, total_samples, frames_done, total_frames)
+    is called after every block, new_frames is a copy of the dB frames that
+    block finished (the matrix itself is rescaled in place later on).
+    Setting the cancel Event raises LoadCancelled.
+    """
+    with sf.SoundFile(file_path) as f:
+        sr = f.samplerate
+        total_samples = f.frames
+        S = _empty_spectrogram(f, n_fft, hop_length)
+        pos = 0
+        peak = 0.0
+        decoded = 0
+        blocks = [] # (start, end, ref in dB) of every block
+
+        for mag, decoded in iter_magnitude_blocks(f, n_fft, hop_length, block_frames):
+            if cancel is not None and cancel.is_set():
+                raise LoadCancelled()
+
+            start = pos
+            S, pos = _append_frames(S, pos, mag)
+            peak = max(peak, float(mag.max()))
+            ref_db = 20.0 * np.log10(max(AMIN, peak))
+            _to_db_inplace(S[:, start:pos], ref_db)
+            blocks.append((start, pos, ref_db))
+
+            if progress is not None:
+                progress(S[:, start:pos].copy(), decoded, total_samples, pos, S.shape[1])
+
+    S = S[:, :pos]
+
+    # second pass, bring every block to the final peak and apply the floor
+    final_db = 20.0 * np.log10(max(AMIN, peak))
+    top = -np.inf
+    for start, end, ref_db in blocks:
+        view = S[:, start:end]
+        if ref_db != final_db:
+            view -= final_db - ref_db
+        top = max(top, float(view.max()))
+
+    if np.isfinite(top):
+        floor = top - TOP_DB
+        for start, end, _ in blocks:
+            view = S[:, start:end]
+            np.maximum(view, floor, out=view)
+
+    return S, sr, decoded
@@ -0,0 +1,157 @@
+"""
+Headless spectrogram export, no GUI needed.
+
+    python batch-analyze.py recordings/ -o out/
+    python batch-analyze.py "recordings/**/*.flac" -o out/ --npy --no-image -j 4
+
+Every file gets the same image the Analyzer tab exports (and/or its dB
+matrix as .npy), under the same relative path it has below the folder (or
+the fixed part of the glob) it was found in, so recordings/a/x.wav and
+recordings/b/x.wav end up as out/a/x.png and out/b/x.png. Files run in
+parallel on a process pool and files whose outputs are newer than the
+audio are skipped. The GUI's spectrogram cache is left alone unless
+--cache-dir asks for one.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from batch_files import find_files, output_path, check_collisions
+from config import CANVAS_SIZE
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3", ".aiff", ".aif", ".m4a")
+
+
+def outputs_for(file_path, root, args):
+    outputs = []
+    if args.image:
+        outputs.append(output_path(file_path, root, args.output, f".{args.format}"))
+    if args.npy:
+        outputs.append(output_path(file_path, root, args.output, ".npy"))
+    return outputs
+
+
+def up_to_date(file_path, outputs):
+    source_time = os.path.getmtime(file_path)
+    return all(os.path.exists(out) and os.path.getmtime(out) >= source_time for out in outputs)
+
+
+def init_worker(stft_threads):
+    # every process runs its own STFT thread pool, split the cores between them
+    import audio.stft
+    audio.stft.STFT_WORKERS = stft_threads
+
+
+def analyze_file(file_path, outputs, args):
+    # runs in a worker process, returns (file, status, load seconds, export seconds)
+    from audio.analyzer import AudioAnalyzer
+    from audio.cache import SpectrogramCache
+    from ui.export import StripExporter
+    from ui.render import RenderPipeline
+
+    start = time.perf_counter()
+    # no cache unless asked, a big batch would push the GUI's entries out
+    cache = SpectrogramCache(args.cache_dir) if args.cache_dir else False
+    analyzer = AudioAnalyzer(cache=cache)
+    ok, message, sr, duration = analyzer.load_file(file_path, high_res=args.high_res)
+    if not ok:
+        return file_path, f"failed: {message}", time.perf_counter() - start, 0.0
+    loaded = time.perf_counter()
+
+    for out in outputs:
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        if out.endswith(".npy"):
+            np.save(out, analyzer.get_spectrogram_data()[0])
+        else:
+            # same size rule as the Analyzer export, pixels per second scaled to the height
+            width = max(1, int(duration * args.pps * args.height / CANVAS_SIZE))
+            pipeline = RenderPipeline()
+            pipeline.set_source(analyzer.S_db, sr)
+            StripExporter(pipeline, width, args.height, args.cmap, args.axis).save(out)
+
+    return file_path, "done", loaded - start, time.perf_counter() - loaded
+
+
+def main():
+    from ui.frequency_axis import AXES
+
+    parser = argparse.ArgumentParser(description="Export spectrograms of many audio files")
+    parser.add_argument("inputs", nargs="+", help="audio files, folders or glob patterns")
+    parser.add_argument("-o", "--output", default="spectrograms", help="output folder")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="worker processes, 0 = one per core")
+    parser.add_argument("--format", default="png", choices=["png", "tif", "jpg"], help="image format")
+    parser.add_argument("--no-image", dest="image", action="store_false", help="skip the image")
+    parser.add_argument("--npy", action="store_true", help="also save the dB matrix as .npy")
+    parser.add_argument("--high-res", action="store_true", help="use the HD hop length")
+    parser.add_argument("--cmap", default="inferno")
+    parser.add_argument("--axis", default="linear", choices=AXES, help="frequency axis")
+    parser.add_argument("--height", type=int, default=2160, help="image height in pixels")
+    parser.add_argument("--pps", type=float, default=100, help="pixels per second at the 720px canvas")
+    parser.add_argument("--force", action="store_true", help="redo files that are up to date")
+    cache = parser.add_mutually_exclusive_group()
+    cache.add_argument("--cache-dir", default=None,
+                       help="keep the spectrograms in this cache folder (default: no cache)")
+    cache.add_argument("--no-cache", dest="cache_dir", action="store_const", const=None,
+                       help="do not cache spectrograms (the default)")
+    args = parser.parse_args()
+
+    if not args.image and not args.npy:
+        parser.error("nothing to do, --no-image needs --npy")
+
+    os.makedirs(args.output, exist_ok=True)
+    files = find_files(args.inputs, AUDIO_EXTENSIONS)
+    if not files:
+        print("No audio files found")
+        return
+
+    planned = [(file_path, outputs_for(file_path, root, args)) for file_path, root in files]
+    # two inputs with the same relative path (from different roots) would write one file
+    check_collisions(planned, parser.error)
+
+    jobs, skipped = [], []
+    for file_path, outputs in planned:
+        if not args.force and up_to_date(file_path, outputs):
+            skipped.append(file_path)
+        else:
+            jobs.append((file_path, outputs))
+
+    cores = os.cpu_count() or 1
+    workers = min(args.jobs if args.jobs > 0 else cores, max(1, len(jobs)))
+    print(f"{len(files)} files, {len(skipped)} up to date, {len(jobs)} to do on {workers} workers")
+
+    results = []
+    start = time.perf_counter()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(max(1, cores // workers),)) as pool:
+            futures = {pool.submit(analyze_file, file_path, outputs, args): file_path
+                       for file_path, outputs in jobs}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = (futures[future], f"failed: {e}", 0.0, 0.0)
+                results.append(result)
+                file_path, status, load_time, export_time = result
+                print(f"[{len(results)}/{len(jobs)}] {os.path.basename(file_path)}: {status}")
+    elapsed = time.perf_counter() - start
+
+    # timing summary
+    print(f"\n{'file':<40} {'status':<10} {'load':>8} {'export':>8} {'total':>8}")
+    for file_path, status, load_time, export_time in sorted(results):
+        print(f"{os.path.basename(file_path)[:40]:<40} {status[:10]:<10} "
+              f"{load_time:>7.2f}s {export_time:>7.2f}s {load_time + export_time:>7.2f}s")
+    for file_path in skipped:
+        print(f"{os.path.basename(file_path)[:40]:<40} {'skipped':<10}")
+
+    done = sum(1 for r in results if r[1] == "done")
+    failed = len(results) - done
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"\n{done} done, {failed} failed, {len(skipped)} skipped in {elapsed:.2f}s ({rate:.2f} files/s)")
+
+
+if __name__ == "__main__":
+    main()
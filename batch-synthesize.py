@@ -0,0 +1,145 @@
+"""
+Headless image -> audio, the Painter tab's Generate without the GUI.
+
+    python batch-synthesize.py images/ -o wavs/
+    python batch-synthesize.py "images/*.png" -o wavs/ --iterations 32 -j 8 --max-memory 1024
+
+Sample rate and duration come from names like RR_44100Hz_3.8s.png when they
+are there (same as loading the image in the Painter tab), the flags are
+used otherwise. The WAVs mirror where the images sit below the folder (or
+the fixed part of the glob) they were found in, so images/a/x.png and
+images/b/x.png become wavs/a/x.wav and wavs/b/x.wav. Images with the same
+settings are reconstructed together in batches of --batch, the batches run
+in parallel on a process pool and every worker is capped at --max-memory
+so one huge job fails instead of swapping the box.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from batch_files import find_files, output_path, check_collisions
+from config import SAMPLE_RATE
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def init_worker(max_memory_mb):
+    # address space limit for this worker, numpy raises MemoryError past it
+    if not max_memory_mb:
+        return
+    try:
+        import resource
+    except ImportError:
+        return # not on windows
+    limit = int(max_memory_mb * 1024 * 1024)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def synthesize(image_paths, output_paths, settings):
+    # runs in a worker process, all images share the settings and go through
+    # Griffin-Lim together. returns [(image, status, seconds)]
+    from PIL import Image
+    from audio.generator import AudioGenerator
+
+    start = time.perf_counter()
+    for wav_path in output_paths:
+        os.makedirs(os.path.dirname(wav_path) or ".", exist_ok=True)
+    try:
+        images = [Image.open(image_path) for image_path in image_paths]
+        # no cache, a batch would only fill up the GUI's audio cache
+        results = AudioGenerator(cache=False).generate_batch(images, settings["duration"], settings["iterations"],
+                                                             output_paths, settings["pitch"],
+                                                             settings["sample_rate"], settings["phase"])
+        statuses = ["done" if target else "failed" for target, _ in results]
+    except MemoryError:
+        statuses = ["failed: over memory cap"] * len(image_paths)
+
+    # the batch ran as one, every image gets its share of the time
+    seconds = (time.perf_counter() - start) / len(image_paths)
+    return [(image_path, status, seconds) for image_path, status in zip(image_paths, statuses)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Turn a folder of images into audio")
+    parser.add_argument("inputs", nargs="+", help="images, folders or glob patterns")
+    parser.add_argument("-o", "--output", default="generated", help="output folder")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="worker processes, 0 = one per core")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds, unless the name has _3.8s")
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE, help="Hz, unless the name has _44100Hz")
+    parser.add_argument("--iterations", type=int, default=16, help="Griffin-Lim iterations")
+    parser.add_argument("--pitch", type=float, default=0, help="pitch shift in semitones")
+    parser.add_argument("--phase", default=None, choices=["griffinlim", "pghi", "pghi+griffinlim"],
+                        help="phase reconstruction (default from config)")
+    parser.add_argument("--batch", type=int, default=8,
+                        help="images with the same settings reconstructed together per job")
+    parser.add_argument("--max-memory", type=float, default=2048, help="MB per worker, 0 = no cap")
+    parser.add_argument("--force", action="store_true", help="redo images whose wav is up to date")
+    args = parser.parse_args()
+
+    from audio.generator import settings_from_filename
+
+    os.makedirs(args.output, exist_ok=True)
+    images = find_files(args.inputs, IMAGE_EXTENSIONS)
+    if not images:
+        print("No images found")
+        return
+
+    planned = [(image_path, [output_path(image_path, root, args.output, ".wav")]) for image_path, root in images]
+    # two images with the same relative path (from different roots) would write one wav
+    check_collisions(planned, parser.error)
+
+    jobs, skipped = [], 0
+    for image_path, (wav_path,) in planned:
+        if (not args.force and os.path.exists(wav_path)
+                and os.path.getmtime(wav_path) >= os.path.getmtime(image_path)):
+            skipped += 1
+            continue
+
+        settings = {"duration": args.duration, "sample_rate": args.sample_rate,
+                    "iterations": args.iterations, "pitch": args.pitch, "phase": args.phase}
+        settings.update(settings_from_filename(image_path))
+        jobs.append((image_path, wav_path, settings))
+
+    # images that share every setting are stacked into one Griffin-Lim call
+    groups = {}
+    for image_path, wav_path, settings in jobs:
+        groups.setdefault(tuple(sorted(settings.items())), []).append((image_path, wav_path))
+    batches = []
+    for key, members in groups.items():
+        for i in range(0, len(members), max(1, args.batch)):
+            chunk = members[i:i + max(1, args.batch)]
+            batches.append(([m[0] for m in chunk], [m[1] for m in chunk], dict(key)))
+
+    workers = min(args.jobs if args.jobs > 0 else (os.cpu_count() or 1), max(1, len(batches)))
+    print(f"{len(images)} images, {skipped} up to date, {len(jobs)} to do in {len(batches)} batches "
+          f"on {workers} workers")
+
+    done = failed = 0
+    start = time.perf_counter()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(args.max_memory,)) as pool:
+            futures = {pool.submit(synthesize, *batch): batch[0] for batch in batches}
+            for future in as_completed(futures):
+                try:
+                    results = future.result()
+                except Exception as e:
+                    # a worker killed outright (OOM killer etc.) breaks the whole pool
+                    results = [(image_path, f"failed: {e}", 0.0) for image_path in futures[future]]
+                for image_path, status, seconds in results:
+                    if status == "done":
+                        done += 1
+                    else:
+                        failed += 1
+                    elapsed = time.perf_counter() - start
+                    print(f"[{done + failed}/{len(jobs)}] {os.path.basename(image_path)}: {status} "
+                          f"({seconds:.2f}s, {done / elapsed:.2f} images/s)")
+    elapsed = time.perf_counter() - start
+
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"\n{done} done, {failed} failed, {skipped} skipped in {elapsed:.2f}s ({rate:.2f} images/s)")
+
+
+if __name__ == "__main__":
+    main()
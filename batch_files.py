@@ -0,0 +1,53 @@
+"""
+Input search shared by the batch-*.py scripts. Every file found keeps the
+path it has below the folder (or the fixed part of the glob) it came
+from, so outputs can mirror it and a/x.wav and b/x.wav stay apart.
+"""
+import glob
+import os
+
+
+def search_root(item):
+    # folder the output paths are made relative to: the folder itself, the
+    # part of a glob before the first wildcard, or a plain file's folder
+    if os.path.isdir(item):
+        return item
+    parts = item.replace("\\", "/").split("/")
+    fixed = []
+    for part in parts[:-1]:
+        if glob.has_magic(part):
+            break
+        fixed.append(part)
+    return "/".join(fixed) or "."
+
+
+def find_files(inputs, extensions):
+    # directories are searched recursively, everything else is a glob or a file.
+    # returns [(file, search root)]
+    files = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "**", "*"), recursive=True)
+        else:
+            matches = glob.glob(item, recursive=True)
+        for m in matches:
+            if os.path.isfile(m) and m.lower().endswith(extensions):
+                files.setdefault(m, search_root(item))
+    return sorted(files.items())
+
+
+def output_path(file_path, root, output_dir, extension):
+    # file_path's place below root, mirrored under output_dir with a new extension
+    name = os.path.splitext(os.path.relpath(file_path, root))[0]
+    return os.path.join(output_dir, name + extension)
+
+
+def check_collisions(outputs, error):
+    # outputs is [(input, [output paths])], error(message) is called for the
+    # first output two inputs would both write
+    owners = {}
+    for file_path, paths in outputs:
+        for out in paths:
+            if out in owners:
+                error(f"{owners[out]} and {file_path} would both be written to {out}")
+            owners[out] = file_path
@@ -0,0 +1,77 @@
+"""
+Compares the phase reconstruction backends of the generator.
+
+    python benchmark-phase.py
+    python benchmark-phase.py car.jpg output-test2.wav --duration 3.8 --repeat 3
+
+Images go through the same preparation as the Painter tab, audio files
+are analysed with the app's STFT so there is a real (consistent) magnitude
+to rebuild. For every backend it prints the time and the spectral
+convergence ||S - |STFT(y)||| / ||S|| (lower is better).
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import librosa
+from PIL import Image
+
+from audio.generator import AudioGenerator
+from audio.phase import reconstruct
+from config import N_FFT, HOP_LENGTH, SAMPLE_RATE
+
+BACKENDS = [
+    ("griffinlim", 8),
+    ("griffinlim", 32),
+    ("griffinlim", 64),
+    ("pghi", 0),
+    ("pghi+griffinlim", 4),
+    ("pghi+griffinlim", 8),
+]
+
+
+def magnitude_for(path, duration, sample_rate):
+    # (name, magnitude) for an image or an audio file
+    if path.lower().endswith((".png", ".jpg", ".jpeg", ".bmp")):
+        return AudioGenerator().image_to_spectrogram(Image.open(path), duration, sample_rate)
+    y, _ = librosa.load(path, sr=None, duration=duration)
+    return np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the phase reconstruction backends")
+    parser.add_argument("inputs", nargs="*", default=["car.jpg", "output-test2.wav"], help="images or audio files")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds of audio per input")
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE, help="sample rate used for images")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per backend, the fastest counts")
+    args = parser.parse_args()
+
+    # first PGHI call compiles the heap integration, keep that out of the numbers
+    reconstruct(np.ones((N_FFT // 2 + 1, 8), dtype=np.float32), "pghi")
+
+    for path in args.inputs:
+        if not os.path.exists(path):
+            print(f"Skipping {path}, not found")
+            continue
+        S = magnitude_for(path, args.duration, args.sample_rate)
+        print(f"\n{os.path.basename(path)}  ({S.shape[0]} bins x {S.shape[1]} frames)")
+        print(f"{'backend':<18} {'max iter':>8} {'ran':>5} {'time':>8} {'convergence':>12} {'speedup':>8}")
+
+        baseline = None
+        for method, n_iter in BACKENDS:
+            best = np.inf
+            for _ in range(max(1, args.repeat)):
+                start = time.perf_counter()
+                _, used, convergence = reconstruct(S, method, n_iter, rng=np.random.default_rng(0))
+                best = min(best, time.perf_counter() - start)
+
+            # speedup against the 32 iteration Griffin-Lim, the old default quality
+            if (method, n_iter) == ("griffinlim", 32):
+                baseline = best
+            speedup = f"{baseline / best:.1f}x" if baseline else "-"
+            print(f"{method:<18} {n_iter:>8} {used:>5} {best:>7.3f}s {float(convergence):>12.4f} {speedup:>8}")
+
+
+if __name__ == "__main__":
+    main()
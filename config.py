@@ -7,6 +7,7 @@ HOP_LENGTH = 512     # Time res
 HOP_LENGTH_HD = 64 # 4x higher time resolution
 
 CANVAS_SIZE = 720
+PAINT_FRAME_MS = 16 # painter strokes are copied to the screen at most once per frame
 
 # Shared memory for export resolution
 # We use a dictionary so both tabs can modify/read the same object
@@ -24,4 +25,116 @@ COLOR_TEXT = "white"
 
 # ANALYZER SETTINGS
 # How many seconds of audio to show on screen
-WINDOW_SIZE = 3.0
\ No newline at end of file
+WINDOW_SIZE = 3.0
+
+# STREAMING ANALYSIS
+# Files longer than this (seconds) are analysed block by block so the
+# decoded audio never has to sit in memory all at once
+STREAM_THRESHOLD_SECONDS = 600
+# How many STFT frames each streamed block produces, at least
+# PARALLEL_MIN_FRAMES so every block still goes through the STFT thread pool
+STREAM_BLOCK_FRAMES = 8192
+# Seconds between progress updates while a file loads in the background
+LOAD_PROGRESS_INTERVAL = 0.25
+
+# SPECTROGRAM CACHE
+# Analysed files are kept here as memory-mapped .npy files
+CACHE_ENABLED = True
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".spectral-analyzer", "cache")
+CACHE_MAX_MB = 2048 # oldest entries are dropped past this size
+# Generated audio is cached too, keyed by the image pixels and the settings
+AUDIO_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".spectral-analyzer", "audio-cache")
+AUDIO_CACHE_MAX_MB = 1024
+
+# PARALLEL STFT
+# Worker threads for the STFT (0 = one per CPU core, 1 = always serial)
+STFT_WORKERS = 0
+# Below this many frames the pool costs more than it saves, run serial
+PARALLEL_MIN_FRAMES = 8192
+
+# SPECTROGRAM STORAGE
+# "float32" keeps full precision, "uint8" stores 256 dB steps between
+# DB_MIN and DB_MAX (what the renderer shows anyway) at a quarter of the memory
+SPECTROGRAM_DTYPE = "float32"
+DB_MIN = -80.0
+DB_MAX = 0.0
+
+# TILED CANVAS
+# The analyzer canvas is drawn as vertical tiles, only the visible ones are rendered
+TILE_WIDTH = 512 # pixels
+TILE_PREFETCH = 1 # extra tiles rendered on each side of the view
+TILE_CACHE_SIZE = 64 # rendered tiles kept around for scrolling back
+
+# ZOOM PYRAMID
+# How frames are merged for the zoomed out levels: "max" keeps short clicks
+# visible, "mean" gives a smoother picture
+PYRAMID_POOLING = "max"
+
+# RENDER PIPELINE
+# Entries kept per render stage (remap, normalize, colourise, resample). The
+# first three work on fixed chunks of frames of a pyramid level, so zooming
+# within a level reuses them and only resample runs again
+RENDER_STAGE_CACHE = 32
+RENDER_CHUNK_FRAMES = 1024
+# Wait this long (ms) after the last zoom/settings change before rendering
+RENDER_DEBOUNCE_MS = 60
+# The instant preview comes from this many pyramid levels below the real one
+PREVIEW_LEVELS = 2
+
+# EXPORT
+# Big exports are rendered in vertical strips and written to disk as they go,
+# so memory stays the same whatever the image width
+EXPORT_STRIP_WIDTH = 1024 # pixels per strip
+EXPORT_TILE_SIZE = 256 # tile size of the tiled TIFF export
+EXPORT_PYRAMID_WORKERS = 0 # processes for the Deep Zoom / XYZ tile export, 0 = one per core
+EXPORT_IN_MEMORY_MAX_MB = 512 # formats without a streaming writer (JPEG) are refused above this
+
+# PHASE RECONSTRUCTION
+# Fast Griffin-Lim: momentum of the update (0 = plain Griffin-Lim) and the
+# early stop, iterating ends once the spectral convergence improves by less
+# than this fraction per iteration (0 = always run every iteration)
+GL_MOMENTUM = 0.99
+GL_TOLERANCE = 2e-3
+# Phase backend of the generator: "griffinlim", "pghi" (one pass, no
+# iterations) or "pghi+griffinlim" (PGHI as the start of Griffin-Lim)
+PHASE_METHOD = "griffinlim"
+# PGHI only integrates bins louder than this fraction of the peak
+PGHI_TOLERANCE = 1e-5
+
+# SEGMENTED SYNTHESIS
+# Long renders are reconstructed in overlapping segments of this many frames
+# (about 11s at 48kHz), cross-faded and written to the file as they finish,
+# so memory does not grow with the duration
+GL_SEGMENT_FRAMES = 1024
+GL_SEGMENT_OVERLAP = 32 # frames shared with each neighbour, half of them are cross-faded
+GL_SEGMENT_WORKERS = 0 # segments reconstructed at once, 0 = one per core
+
+# INCREMENTAL REGENERATION
+# After a small edit only the changed frames are iterated again, starting from
+# the last render's phase. Frames around the change that are iterated too:
+INCREMENTAL_MARGIN = 8
+# above this fraction of changed frames the whole render is redone
+INCREMENTAL_MAX_FRACTION = 0.5
+
+# PAINTER PREVIEW
+# Rough audio played from memory after every stroke, the full render stays on
+# the GENERATE button. Lower sample rate, smaller STFT, 1-2 iterations
+# (0 = random phase only)
+PREVIEW_SAMPLE_RATE = 16000
+PREVIEW_N_FFT = 512
+PREVIEW_HOP_LENGTH = 128
+PREVIEW_ITERATIONS = 2
+PREVIEW_DELAY_MS = 150 # wait after the mouse is released before synthesising
+
+# LIVE SONIFICATION
+# Painter "Live" mode, a playhead loops over the canvas and the columns under
+# it are synthesised just before they are played. The blocksize is the
+# latency budget of one audio callback, LIVE_LEAD_BLOCKS are kept ready ahead
+# of it. Every extra block is one more buffer period before a stroke is
+# heard, only raise it if the underrun counter in LiveEngine.stats climbs
+LIVE_SAMPLE_RATE = 22050
+LIVE_N_FFT = 1024
+LIVE_HOP_LENGTH = 256
+LIVE_BLOCKSIZE = 1024 # samples per callback, ~46 ms at 22050 Hz
+LIVE_LEAD_BLOCKS = 1
+LIVE_PLAYHEAD_MS = 30 # playhead redraw interval
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from audio.cache import SpectrogramCache, AudioCache, hash_file, hash_image
+from config import CACHE_DIR, AUDIO_CACHE_DIR
+
+
+def test_spectrogram_round_trip(tmp_path):
+    cache = SpectrogramCache(str(tmp_path))
+    S = np.random.default_rng(0).standard_normal((65, 40)).astype(np.float32)
+    key = cache.make_key("abc", 128, 32, 16000)
+
+    assert cache.get(key) == (None, None)
+    stored = cache.put(key, S, {"duration": 1.5})
+    assert isinstance(stored, np.memmap)
+
+    loaded, meta = cache.get(key)
+    assert isinstance(loaded, np.memmap)
+    np.testing.assert_array_equal(loaded, S)
+    assert meta == {"duration": 1.5}
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_spectrogram_eviction_drops_the_oldest(tmp_path):
+    S = np.zeros((100, 100), dtype=np.float32) # about 40kB per entry
+    cache = SpectrogramCache(str(tmp_path), max_mb=0.13) # room for three
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, S)
+        os.utime(cache.path_for(key), (i, i)) # well apart, mtime resolution varies
+    cache.get("a") # a hit counts as recent
+
+    cache.put("d", S)
+    assert cache.contains("a") and cache.contains("d")
+    assert not cache.contains("b") and cache.contains("c")
+
+
+def test_hash_file_follows_the_content(tmp_path):
+    path = tmp_path / "x.bin"
+    path.write_bytes(b"one")
+    first = hash_file(str(path))
+    assert hash_file(str(path)) == first
+    path.write_bytes(b"two")
+    assert hash_file(str(path)) != first
+
+
+def test_audio_round_trip(tmp_path):
+    cache = AudioCache(str(tmp_path / "audio"))
+    wav = tmp_path / "render.wav"
+    wav.write_bytes(b"RIFF fake wav")
+    out = tmp_path / "out.wav"
+
+    assert not cache.get("k", str(out))
+    cache.put("k", str(wav))
+    assert cache.get("k", str(out))
+    assert out.read_bytes() == b"RIFF fake wav"
+
+    # the output is a copy, writing it leaves the cached file alone
+    out.write_bytes(b"changed")
+    assert open(cache.path_for("k"), "rb").read() == b"RIFF fake wav"
+
+
+def test_hash_image_covers_pixels_and_settings():
+    image = Image.new("L", (8, 4), "black")
+    key = hash_image(image, 2.0, 48000)
+    assert hash_image(image.copy(), 2.0, 48000) == key
+    assert hash_image(image, 2.0, 44100) != key
+
+    image.putpixel((3, 2), 1)
+    assert hash_image(image, 2.0, 48000) != key
+
+
+def test_audio_cache_is_not_inside_the_spectrogram_cache():
+    inside = os.path.commonpath([CACHE_DIR, AUDIO_CACHE_DIR]) == os.path.normpath(CACHE_DIR)
+    assert not inside
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from ui.export import StripExporter, write_png, write_tiled_tiff
+from ui.render import RenderPipeline
+
+SR = 16000
+
+
+def pipeline(n_frames=3000):
+    rng = np.random.default_rng(0)
+    # smooth along time so the resize has something to interpolate
+    S = np.cumsum(rng.standard_normal((129, n_frames)), axis=1)
+    S = (-80 * (S - S.min()) / (S.max() - S.min())).astype(np.float32)
+    p = RenderPipeline()
+    p.set_source(S, SR)
+    return p
+
+
+def strips_of(image, strip_width):
+    return [(x0, image[:, x0:x0 + strip_width]) for x0 in range(0, image.shape[1], strip_width)]
+
+
+def test_strips_join_like_one_resize():
+    p = pipeline()
+    n_frames = p.source.pyramid.base.shape[1]
+    full = Image.fromarray(p.export_frames(0, n_frames, "magma")).resize((1700, 200), Image.Resampling.LANCZOS)
+
+    for strip_width in (256, 333):
+        exporter = StripExporter(p, 1700, 200, "magma", strip_width=strip_width)
+        joined = np.concatenate([strip for _, strip in exporter.strips()], axis=1)
+        assert joined.shape == (200, 1700, 3)
+        diff = np.abs(joined.astype(np.int16) - np.asarray(full, dtype=np.int16))
+        assert diff.max() <= 1
+
+
+def test_png_reads_back(tmp_path):
+    image = np.random.default_rng(1).integers(0, 256, (70, 300, 3), dtype=np.uint8)
+    path = str(tmp_path / "out.png")
+    write_png(path, 300, 70, strips_of(image, 128))
+    np.testing.assert_array_equal(np.asarray(Image.open(path).convert("RGB")), image)
+
+
+@pytest.mark.parametrize("big", [False, True])
+def test_tiled_tiff_reads_back(tmp_path, big):
+    # not a whole number of tiles either way, the edges get padded
+    image = np.random.default_rng(2).integers(0, 256, (150, 300, 3), dtype=np.uint8)
+    path = str(tmp_path / "out.tif")
+    write_tiled_tiff(path, 300, 150, strips_of(image, 100), tile=64, big=big)
+
+    with open(path, "rb") as f:
+        assert f.read(4) == (b"II+\x00" if big else b"II*\x00")
+    with Image.open(path) as tiff:
+        assert tiff.size == (300, 150)
+        np.testing.assert_array_equal(np.asarray(tiff.convert("RGB")), image)
+
+
+def test_jpeg_over_the_memory_cap_is_refused(tmp_path, monkeypatch):
+    import ui.export
+    monkeypatch.setattr(ui.export, "EXPORT_IN_MEMORY_MAX_MB", 0.01)
+    with pytest.raises(ValueError):
+        StripExporter(pipeline(200), 300, 100, "magma").save(str(tmp_path / "out.jpg"))
@@ -0,0 +1,57 @@
+import numpy as np
+import librosa
+import pytest
+
+from ui.frequency_axis import AXES, F_MIN, CQT_F_MIN, CQT_BINS_PER_OCTAVE, frequency_operator, remap
+
+SR = 16000
+N_BINS = 257
+
+
+def spectrum():
+    rng = np.random.default_rng(0)
+    return (-80 * rng.random((N_BINS, 12))).astype(np.float32)
+
+
+def dense_interp(S, freqs):
+    # per column np.interp on the linear bin frequencies, clamped at the ends
+    linear = np.linspace(0, SR / 2, N_BINS)
+    return np.stack([np.interp(freqs, linear, column) for column in S.T], axis=1)
+
+
+def test_linear_is_a_no_op():
+    S = spectrum()
+    assert frequency_operator("linear", SR, N_BINS) is None
+    assert remap(S, SR, "linear") is S
+
+
+@pytest.mark.parametrize("axis, freqs", [
+    ("log", np.geomspace(F_MIN, SR / 2, 300)),
+    ("mel", librosa.mel_frequencies(300, fmin=F_MIN, fmax=SR / 2)),
+])
+def test_interpolating_axes_match_np_interp(axis, freqs):
+    S = spectrum()
+    out = remap(S, SR, axis, n_out=300)
+    assert out.dtype == np.float32 and out.shape == (300, S.shape[1])
+    np.testing.assert_allclose(out, dense_interp(S, freqs), atol=1e-3)
+
+
+def test_cqt_bands_average_and_find_the_tone():
+    op = frequency_operator("cqt", SR, N_BINS)
+    np.testing.assert_allclose(np.asarray(op.sum(axis=1)).ravel(), 1.0, atol=1e-5)
+
+    # a single 1 kHz bin lights up the band whose centre is closest
+    S = np.zeros((N_BINS, 1), dtype=np.float32)
+    S[round(1000 / (SR / 2) * (N_BINS - 1))] = 1.0
+    band = int(np.argmax(remap(S, SR, "cqt")))
+    assert band == round(np.log2(1000 / CQT_F_MIN) * CQT_BINS_PER_OCTAVE)
+
+
+def test_operators_are_built_once():
+    for axis in AXES[1:]:
+        assert frequency_operator(axis, SR, N_BINS) is frequency_operator(axis, SR, N_BINS)
+
+
+def test_unknown_axis():
+    with pytest.raises(ValueError):
+        frequency_operator("bark", SR, N_BINS)
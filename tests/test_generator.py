@@ -0,0 +1,73 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+import audio.generator
+from audio.generator import AudioGenerator
+from config import INCREMENTAL_MARGIN
+
+SR = 16000
+DURATION = 2.0
+
+
+def painted_image():
+    image = Image.new("L", (120, 80), "black")
+    draw = ImageDraw.Draw(image)
+    draw.line((0, 40, 119, 40), fill=255, width=3)
+    draw.line((0, 60, 119, 20), fill=200, width=2)
+    return image
+
+
+def render(generator, image, path, iterations=4, phase_method="griffinlim", dirty_columns=None):
+    target, _ = generator.generate_from_image(image, DURATION, iterations, str(path), sample_rate=SR,
+                                              phase_method=phase_method, dirty_columns=dirty_columns)
+    assert target == str(path)
+
+
+def test_untouched_frames_keep_their_phase(tmp_path):
+    generator = AudioGenerator(cache=False)
+    image = painted_image()
+    render(generator, image, tmp_path / "first.wav")
+    last = generator.last_render
+
+    # a short stroke at the right end only
+    edited = image.copy()
+    ImageDraw.Draw(edited).line((110, 10, 115, 10), fill=255, width=2)
+    dirty = set(range(105, 120))
+    S = generator.image_to_spectrogram(edited, DURATION, SR)
+
+    changed = generator.changed_frames(S, edited.width, dirty)
+    assert 0 < changed.sum() < changed.size / 2
+
+    angles = generator.update_phase(S, last["settings"], edited.width, dirty, iterations=4)
+    assert angles is not None
+
+    # frames further than the iterated margin from any change are copied over
+    first_changed = int(np.flatnonzero(changed)[0])
+    keep = first_changed - INCREMENTAL_MARGIN
+    np.testing.assert_array_equal(angles[:, :keep], last["angles"][:, :keep])
+    assert not np.allclose(angles[:, first_changed:], last["angles"][:, first_changed:])
+
+
+def test_settings_change_forces_full_rebuild(tmp_path, monkeypatch):
+    generator = AudioGenerator(cache=False)
+    image = painted_image()
+    render(generator, image, tmp_path / "first.wav")
+
+    calls = []
+    reconstruct = audio.generator.reconstruct
+
+    def counting(*args, **kwargs):
+        calls.append(kwargs.get("method"))
+        return reconstruct(*args, **kwargs)
+
+    monkeypatch.setattr(audio.generator, "reconstruct", counting)
+
+    # same image and settings, only the incremental path runs
+    render(generator, image, tmp_path / "same.wav", dirty_columns=set())
+    assert calls == []
+
+    # another quality or phase method is a new render, whatever changed in the image
+    render(generator, image, tmp_path / "quality.wav", iterations=8, dirty_columns=set())
+    assert calls == ["griffinlim"]
+    render(generator, image, tmp_path / "method.wav", iterations=8, phase_method="pghi", dirty_columns=set())
+    assert calls == ["griffinlim", "pghi"]
@@ -0,0 +1,79 @@
+import numpy as np
+import librosa
+import pytest
+
+import audio.phase
+from audio.phase import griffinlim, reconstruct, phase_gradients, spectral_convergence
+from config import GL_TOLERANCE, PGHI_TOLERANCE
+
+SR = 16000
+N_FFT = 512
+HOP = 128
+
+
+def tone_magnitude(freq=1000.0, seconds=1.0):
+    t = np.arange(int(SR * seconds)) / SR
+    y = 0.5 * np.sin(2 * np.pi * freq * t).astype(np.float32)
+    return np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP)), len(y)
+
+
+def test_griffinlim_stops_once_it_settles():
+    S, length = tone_magnitude()
+    rng = np.random.default_rng(0)
+    _, iterations, convergence = griffinlim(S, 200, HOP, N_FFT, tol=GL_TOLERANCE, length=length, rng=rng)
+    assert iterations < 200
+    assert convergence < 0.1
+
+    # tol=0 always runs the full count
+    _, iterations, _ = griffinlim(S, 5, HOP, N_FFT, tol=0, length=length, rng=rng)
+    assert iterations == 5
+
+
+def test_pghi_rebuilds_a_pure_tone():
+    S, length = tone_magnitude()
+    y, iterations, convergence = reconstruct(S, "pghi", hop_length=HOP, n_fft=N_FFT, length=length,
+                                             rng=np.random.default_rng(0))
+    assert iterations == 0
+    assert len(y) == length
+    assert convergence < 0.05
+
+    # and does much better than a random phase
+    _, _, random = griffinlim(S, 1, HOP, N_FFT, tol=0, length=length, rng=np.random.default_rng(0))
+    assert convergence < random / 2
+
+
+@pytest.mark.skipif(audio.phase._integrate_heap_numba is None, reason="numba not installed")
+def test_numba_and_python_heap_agree():
+    S, _ = tone_magnitude(seconds=0.25)
+    # a second, quieter tone so there is more than one ridge to follow
+    S = S + 0.3 * tone_magnitude(2500.0, seconds=0.25)[0]
+    mag = S.astype(np.float64)
+    time_grad, freq_grad = phase_gradients(S, HOP, N_FFT)
+    floor = float(S.max()) * PGHI_TOLERANCE
+
+    results = []
+    for integrate in (audio.phase._integrate_heap_numba, audio.phase._integrate_heap):
+        phase = np.zeros(S.shape)
+        done = np.zeros(S.shape, dtype=np.bool_)
+        integrate(mag, time_grad, freq_grad, floor, phase, done)
+        results.append((phase, done))
+
+    (jit_phase, jit_done), (py_phase, py_done) = results
+    assert jit_done.any()
+    np.testing.assert_array_equal(jit_done, py_done)
+    np.testing.assert_allclose(jit_phase, py_phase, rtol=0, atol=1e-9)
+
+
+def test_spectral_convergence_is_zero_for_the_same_magnitude():
+    S, _ = tone_magnitude(seconds=0.1)
+    assert spectral_convergence(S, S * np.exp(1j)) == pytest.approx(0.0, abs=1e-6)
+
+
+def test_unknown_method_fails_before_any_work(monkeypatch):
+    def never(*args, **kwargs):
+        raise AssertionError("PGHI ran for a bad method name")
+
+    monkeypatch.setattr(audio.phase, "pghi_phase", never)
+    S, _ = tone_magnitude(seconds=0.1)
+    with pytest.raises(ValueError):
+        reconstruct(S, "pgh", hop_length=HOP, n_fft=N_FFT)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import ui.render
+from ui.render import RenderPipeline, column_index, row_index, colormap_lut, apply_lut, remap_frequency
+from audio.compact import as_levels
+
+SR = 16000
+
+
+def spectrogram(n_frames=5000):
+    rng = np.random.default_rng(0)
+    return (-80 * rng.random((129, n_frames))).astype(np.float32)
+
+
+def whole_level(S, width, height, axis):
+    # the same picture from the full level in one go
+    cols = column_index(0, width, width, S.shape[1])
+    rgb = apply_lut(as_levels(remap_frequency(S, SR, axis)), colormap_lut("magma"))
+    return rgb[row_index(height, rgb.shape[0])[:, None], cols]
+
+
+@pytest.mark.parametrize("axis", ["linear", "log", "mel"])
+def test_tiles_match_the_whole_level(axis):
+    S = spectrogram()
+    pipeline = RenderPipeline(chunk_frames=700)
+    pipeline.set_source(S, SR)
+    width, height = 3000, 90
+
+    tiles = [pipeline.render_columns(x0, min(x0 + 512, width), width, height, "magma", axis)
+             for x0 in range(0, width, 512)]
+    np.testing.assert_array_equal(np.concatenate(tiles, axis=1), whole_level(S, width, height, axis))
+
+
+def test_zoom_on_the_same_level_reuses_the_chunks(monkeypatch):
+    calls = []
+    original = ui.render.remap_frequency
+
+    def counting(S, sr, axis):
+        calls.append(S.shape[1])
+        return original(S, sr, axis)
+
+    monkeypatch.setattr(ui.render, "remap_frequency", counting)
+    pipeline = RenderPipeline(chunk_frames=1024)
+    pipeline.set_source(spectrogram(), SR)
+
+    for x0 in range(0, 4000, 512):
+        pipeline.render_columns(x0, min(x0 + 512, 4000), 4000, 90, "magma", "log")
+    first = len(calls)
+    assert first == 5 # one per chunk of the 5000 frames
+
+    # 4000 -> 4100 px stays on level 0, nothing upstream of resample runs again
+    for x0 in range(0, 4100, 512):
+        pipeline.render_columns(x0, min(x0 + 512, 4100), 4100, 90, "magma", "log")
+    assert len(calls) == first
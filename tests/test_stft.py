@@ -0,0 +1,59 @@
+import threading
+
+import numpy as np
+import soundfile as sf
+import librosa
+import pytest
+
+from audio.stft import frame_count, stft_magnitude, stream_spectrogram_db, LoadCancelled
+from config import PARALLEL_MIN_FRAMES
+
+SR = 16000
+N_FFT = 256
+HOP = 64
+
+
+def noisy_chirp(seconds):
+    t = np.arange(int(SR * seconds)) / SR
+    rng = np.random.default_rng(0)
+    y = 0.5 * np.sin(2 * np.pi * (200 + 1500 * t) * t) + 0.05 * rng.standard_normal(len(t))
+    return y.astype(np.float32)
+
+
+def test_streaming_matches_one_shot(tmp_path):
+    y = noisy_chirp(3.0)
+    path = str(tmp_path / "chirp.wav")
+    sf.write(path, y, SR, subtype="FLOAT")
+
+    chunks = []
+    S, sr, decoded = stream_spectrogram_db(path, N_FFT, HOP, block_frames=100,
+                                           progress=lambda new, *rest: chunks.append(new.shape[1]))
+    expected = librosa.amplitude_to_db(np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP)), ref=np.max)
+
+    assert sr == SR and decoded == len(y)
+    assert S.shape == expected.shape == (N_FFT // 2 + 1, frame_count(len(y), HOP))
+    assert len(chunks) > 1 and sum(chunks) == S.shape[1]
+    np.testing.assert_allclose(S, expected, atol=1e-3)
+
+
+@pytest.mark.parametrize("center", [True, False])
+def test_parallel_stft_matches_librosa(center):
+    # long enough to be split into segments
+    y = noisy_chirp((PARALLEL_MIN_FRAMES + 500) * HOP / SR)
+    expected = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP, center=center))
+
+    done = []
+    parallel = stft_magnitude(y, N_FFT, HOP, center=center, workers=4, progress=lambda d, n: done.append((d, n)))
+    serial = stft_magnitude(y, N_FFT, HOP, center=center, workers=1)
+
+    assert len(done) > 1 and done[-1] == (expected.shape[1], expected.shape[1])
+    np.testing.assert_array_equal(parallel, serial)
+    np.testing.assert_allclose(parallel, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_stft_cancel():
+    y = noisy_chirp(PARALLEL_MIN_FRAMES * HOP / SR)
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(LoadCancelled):
+        stft_magnitude(y, N_FFT, HOP, workers=2, cancel=cancel)
@@ -9,12 +9,16 @@ import librosa.display
 # Added more libraries for the smoother update
 import numpy as np
 from PIL import Image, ImageTk
-import matplotlib.cm as cm
-from scipy.interpolate import interp1d
+from collections import OrderedDict
 
 from audio.analyzer import AudioAnalyzer
 from audio.player import AudioPlayer
+from ui.render import RenderPipeline, render_partial_columns
+from ui.export import StripExporter, write_tile_pyramid
+from ui.frequency_axis import AXES
 from config import COLOR_BG, WINDOW_SIZE, HOP_LENGTH, HOP_LENGTH_HD, CANVAS_SIZE, EXPORT_DIMENSIONS
+from config import TILE_WIDTH, TILE_PREFETCH, TILE_CACHE_SIZE, RENDER_DEBOUNCE_MS, PREVIEW_LEVELS
+from config import LOAD_PROGRESS_INTERVAL
 
 class AnalyzerTab(ctk.CTkFrame):
     def __init__(self, master, **kwargs):
@@ -25,7 +29,7 @@ class AnalyzerTab(ctk.CTkFrame):
 
         self.hide_axis_var = ctk.BooleanVar(value=False) # track hide axis
         self.high_res_var = ctk.BooleanVar(value=False) # track high res
-        self.log_scale_var = ctk.BooleanVar(value=False) # track log scale
+        self.freq_axis_var = ctk.StringVar(value="linear") # track frequency axis
 
         self.current_hop = HOP_LENGTH # track which resolution we are using
 
@@ -36,12 +40,33 @@ class AnalyzerTab(ctk.CTkFrame):
         self.current_file_path = None # added this to track the file
         self.playback_thread = None
         self.playback_position = 0.0
+
+        # Background loading state
+        self.loading = False
+        self.load_thread = None
+        self.load_cancel = None
+        self.load_shown = 0 # output columns the progressive view has drawn
+        self.load_images = [] # strips drawn while loading, kept referenced
+        self.load_width = 0
+        self.load_height = 0
+        self.last_progress = 0.0
+        self.load_pending = [] # dB frames finished since the last progress update
         
         # Canvas rendering state
-        self.spectrogram_image = None
-        self.tk_image = None
         self.pixels_per_second = 100 # default zoom
         self.cursor_line = None
+
+        # Tiled rendering, only the tiles in view are drawn
+        self.render_key = None
+        self.render_width = 0
+        self.render_height = 0
+        self.tile_cache = OrderedDict() # (render_key, tile) -> PhotoImage, oldest first
+        self.tile_items = {} # tile -> (canvas item, PhotoImage) currently shown
+        self.tiles_pending = False
+        self.pipeline = RenderPipeline() # shared by the canvas and the export
+        self.render_request = 0 # newest background render, older ones give up
+        self.render_after_id = None
+        self.preview_image = None
         
         # Matplotlib objects (kept for export only)
         self.figure = None
@@ -99,12 +124,11 @@ class AnalyzerTab(ctk.CTkFrame):
                                         width=20)
         self.chk_axis.pack(side="right", padx=10)
 
-        # Log Scale Checkbox
-        self.chk_log = ctk.CTkCheckBox(controls, text="Log Scale", 
-                                        variable=self.log_scale_var, 
-                                        command=lambda: self.redraw_map(None),
-                                        width=20)
-        self.chk_log.pack(side="right", padx=10)
+        # Frequency Axis Selector (linear / log / mel / constant-Q style)
+        self.combo_axis = ctk.CTkComboBox(controls, values=list(AXES),
+                                         variable=self.freq_axis_var, command=self.redraw_map, width=90)
+        self.combo_axis.pack(side="right", padx=5)
+        ctk.CTkLabel(controls, text="Freq:").pack(side="right", padx=(10, 0))
 
 
         # High Res Checkbox
@@ -128,6 +152,7 @@ class AnalyzerTab(ctk.CTkFrame):
         self.canvas.bind("<Button-4>", self.on_scroll)
         self.canvas.bind("<Button-5>", self.on_scroll)
         self.canvas.bind("<Configure>", self.on_resize)
+        self.canvas.configure(xscrollcommand=self.on_view_change)
         
         # Setup Plot for EXPORT ONLY (off-screen)
         self.setup_plot_backend()
@@ -142,22 +167,31 @@ class AnalyzerTab(ctk.CTkFrame):
         self.ax.axis('off')
 
     def on_resize(self, event):
-        pass
+        if self.render_key is None:
+            return
+        # a new height changes every tile, a new width just shows more of them
+        height = event.height if event.height >= 100 else 400
+        if height != self.render_height:
+            self.generate_spectrogram_image()
+        else:
+            self.on_view_change(None, None)
     
     def on_zoom_change(self, value):
         self.pixels_per_second = float(value)
         if self.analyzer.S_db is not None:
              self.generate_spectrogram_image(update_zoom=False)
              
-    def on_log_scale_change(self):
-        if self.analyzer.S_db is not None:
-            self.generate_spectrogram_image()
-            
     def redraw_map(self, _):
         if self.analyzer.S_db is not None:
             self.generate_spectrogram_image()
 
     def load_audio(self):
+        # while a file is loading the same button cancels it
+        if self.loading:
+            self.load_cancel.set()
+            self.lbl_time.configure(text="Cancelling...")
+            return
+
         file_path = filedialog.askopenfilename(
             filetypes=[("Audio Files", "*.wav *.mp3 *.ogg")]
         )
@@ -165,81 +199,148 @@ class AnalyzerTab(ctk.CTkFrame):
         if file_path:
             self.lbl_time.configure(text="Loading...")
             self.current_file_path = file_path # saving the path for pygame
-            self.update() # force UI refresh
-            
-            # Use the logic class to process the file
-            success, name, sr, dur = self.analyzer.load_file(file_path)
-            
-            if success:
-                self.duration = dur
-                self.btn_play.configure(state="normal")
-                self.btn_stop.configure(state="normal")
-                self.btn_export.configure(state="normal") # load export button on success
-                self.lbl_time.configure(text=f"0:00 / {self.format_time(self.duration)}")
-                
-                # zooming
-                canvas_width = self.canvas.winfo_width()
-                if canvas_width > 100:
-                    default_width = self.duration * 100
-                    if default_width < canvas_width:
-                        new_pps = canvas_width / self.duration
-                        new_pps = max(10, min(500, new_pps))
-                        self.pixels_per_second = new_pps
-                        self.slider_zoom.set(new_pps)
-                    else:
-                        self.pixels_per_second = 100
-                        self.slider_zoom.set(100)
-                        
-                self.generate_spectrogram_image(update_zoom=False)
+
+            # drop the old picture and stop any render still going for it
+            self.render_key = None
+            self.render_request += 1
+            self.canvas.delete("all")
+
+            self.loading = True
+            self.load_cancel = threading.Event()
+            self.load_shown = 0
+            self.load_width = 0
+            self.load_images = []
+            self.last_progress = 0.0
+            self.load_pending = []
+            self.btn_load.configure(text="Cancel Load")
+            self.btn_play.configure(state="disabled")
+            self.btn_stop.configure(state="disabled")
+            self.btn_export.configure(state="disabled")
+
+            # decode + STFT off the UI thread
+            self.load_thread = threading.Thread(target=self.run_load,
+                                                args=(file_path, self.load_cancel, self.high_res_var.get()))
+            self.load_thread.daemon = True
+            self.load_thread.start()
+
+    def run_load(self, file_path, cancel, high_res):
+        # Use the logic class to process the file
+        result = self.analyzer.load_file(file_path, high_res=high_res,
+                                         progress=self.report_progress, cancel=cancel)
+        self.after(0, self.finish_load, result)
+
+    def report_progress(self, new_frames, decoded, total_samples, frames_done, total_frames):
+        # worker thread, only a few updates per second go to the UI. the frames
+        # in between are collected so the update can draw all of them
+        if new_frames is not None:
+            self.load_pending.append(new_frames)
+        now = time.time()
+        if now - self.last_progress < LOAD_PROGRESS_INTERVAL and frames_done < total_frames:
+            return
+        self.last_progress = now
+
+        S_new = None
+        if self.load_pending:
+            S_new = np.concatenate(self.load_pending, axis=1) if len(self.load_pending) > 1 else self.load_pending[0]
+            self.load_pending = []
+        self.after(0, self.show_load_progress, S_new, decoded, total_samples, frames_done, total_frames)
+
+    def show_load_progress(self, S_new, decoded, total_samples, frames_done, total_frames):
+        if not self.loading:
+            return
+
+        percent = 100 * frames_done / max(total_frames, 1)
+        self.lbl_time.configure(text=f"Loading {percent:.0f}% ({decoded:,} samples, {frames_done:,} frames)")
+
+        sr = self.analyzer.sr
+        if self.load_width == 0:
+            # first block, lay out the canvas for the whole file
+            self.duration = total_samples / sr
+            self.fit_zoom()
+            self.load_height = self.canvas.winfo_height()
+            if self.load_height < 100: self.load_height = 400
+            self.load_width = max(1, int(self.duration * self.pixels_per_second))
+            self.canvas.configure(scrollregion=(0, 0, self.load_width, self.load_height))
+            self.canvas.xview_moveto(0)
+
+        # draw the columns finished since last time, left to right, if they are in view
+        x_done = int(frames_done * self.load_width / total_frames - 0.5)
+        left = int(self.canvas.canvasx(0))
+        right = left + max(self.canvas.winfo_width(), 1)
+        x0 = max(self.load_shown, left)
+        x1 = min(x_done, right, self.load_width)
+        if x1 > x0 and S_new is not None:
+            # S_new holds the frames that end at frames_done
+            first = frames_done - S_new.shape[1]
+            rgb = render_partial_columns(S_new, sr, total_frames, x0, x1, self.load_width,
+                                         self.load_height, self.cmap_var.get(), self.frequency_axis(),
+                                         first_frame=first)
+            image = ImageTk.PhotoImage(Image.fromarray(rgb))
+            self.load_images.append(image)
+            self.canvas.create_image(x0, 0, image=image, anchor="nw", tags="loading")
+        self.load_shown = max(self.load_shown, x_done)
+
+    def finish_load(self, result):
+        success, name, sr, dur = result
+        self.loading = False
+        self.load_images = []
+        self.btn_load.configure(text="Load Audio File")
+        self.current_hop = self.analyzer.hop_length
+
+        if success:
+            self.duration = dur
+            self.tile_cache.clear() # same path could be a different file now
+            self.btn_play.configure(state="normal")
+            self.btn_stop.configure(state="normal")
+            self.btn_export.configure(state="normal") # load export button on success
+            self.lbl_time.configure(text=f"0:00 / {self.format_time(self.duration)}")
+
+            self.fit_zoom()
+            self.generate_spectrogram_image(update_zoom=False)
+        elif name == "Cancelled":
+            self.canvas.delete("all")
+            self.lbl_time.configure(text="Load cancelled")
+        else:
+            self.canvas.delete("all")
+            self.lbl_time.configure(text="Error loading file")
+
+    def fit_zoom(self):
+        # zooming
+        canvas_width = self.canvas.winfo_width()
+        if canvas_width > 100 and self.duration > 0:
+            default_width = self.duration * 100
+            if default_width < canvas_width:
+                new_pps = canvas_width / self.duration
+                new_pps = max(10, min(500, new_pps))
+                self.pixels_per_second = new_pps
+                self.slider_zoom.set(new_pps)
             else:
-                self.lbl_time.configure(text="Error loading file")
+                self.pixels_per_second = 100
+                self.slider_zoom.set(100)
 
 
     def generate_spectrogram_image(self, update_zoom=False):
-        S_db, sr = self.analyzer.get_spectrogram_data()
-        
-        if S_db is None:
+        if self.analyzer.S_db is None:
             return
 
-        # Prepare frequency grid
-        data_to_plot = S_db
-        if self.log_scale_var.get():
-            try:
-                n_bins, n_frames = S_db.shape
-                freqs_lin = np.linspace(0, sr/2, n_bins)
-                freqs_log = np.geomspace(20, sr/2, n_bins)
-                f = interp1d(freqs_lin, S_db, axis=0, kind='linear', fill_value="extrapolate")
-                data_to_plot = f(freqs_log)
-            except Exception as e:
-                print(f"Log scale error: {e}")
-                data_to_plot = S_db
-
-        # Normalize 0-1
-        min_db = -80.0
-        max_db = 0.0
-        norm_data = (data_to_plot - min_db) / (max_db - min_db)
-        norm_data = np.clip(norm_data, 0, 1)
-        norm_data = np.flipud(norm_data)
-        
-        # Colormap
-        cmap = cm.get_cmap(self.cmap_var.get()) # Use the selected cmap
-        mapped_data = cmap(norm_data)
-        img_data = (mapped_data * 255).astype(np.uint8)
-        pil_image = Image.fromarray(img_data)
-        
         # Dimensions
         canvas_height = self.canvas.winfo_height()
         if canvas_height < 100: canvas_height = 400
         
-        target_width = int(self.duration * self.pixels_per_second)
-        
-        # Resize
-        self.spectrogram_image = pil_image.resize((target_width, canvas_height), Image.Resampling.NEAREST)
-        self.tk_image = ImageTk.PhotoImage(self.spectrogram_image)
+        target_width = max(1, int(self.duration * self.pixels_per_second))
+
+        # only resets the stage caches when the matrix itself changed
+        self.pipeline.set_source(self.analyzer.S_db, self.analyzer.sr)
+
+        # anything that changes how a tile looks goes in the key
+        self.render_key = (self.pipeline.version, self.cmap_var.get(),
+                           self.frequency_axis(), target_width, canvas_height)
+        self.render_width = target_width
+        self.render_height = canvas_height
         
-        # Draw on Canvas
+        # Clear the Canvas, tiles get drawn by update_tiles
         self.canvas.delete("all")
-        self.canvas.create_image(0, 0, image=self.tk_image, anchor="nw", tags="spectrogram")
+        self.tile_items = {}
         
         # Draw Cursor (Red Line)
         self.cursor_line = self.canvas.create_line(0, 0, 0, canvas_height, fill="red", width=2, tags="cursor")
@@ -247,9 +348,139 @@ class AnalyzerTab(ctk.CTkFrame):
         # Setup scrolling
         self.canvas.configure(scrollregion=(0, 0, target_width, canvas_height))
         self.canvas.xview_moveto(0)
+        self.update_tiles()
+
+    def frequency_axis(self):
+        return self.freq_axis_var.get()
+
+    def on_view_change(self, first, last):
+        # called by tk every time the visible x range moves
+        if not self.tiles_pending:
+            self.tiles_pending = True
+            self.after_idle(self.update_tiles)
+
+    def visible_tiles(self):
+        # tiles in view plus a margin, the ones closest to the middle first
+        left = self.canvas.canvasx(0)
+        right = left + max(self.canvas.winfo_width(), 1)
+        first = max(0, int(left // TILE_WIDTH) - TILE_PREFETCH)
+        last = min((self.render_width - 1) // TILE_WIDTH, int(right // TILE_WIDTH) + TILE_PREFETCH)
+        middle = (left + right) / 2 / TILE_WIDTH
+        return sorted(range(first, last + 1), key=lambda tile: abs(tile + 0.5 - middle))
+
+    def update_tiles(self):
+        # draw the tiles in view and drop the ones that left it, anything not
+        # rendered yet goes to the background worker
+        self.tiles_pending = False
+        if self.render_key is None:
+            return
+
+        wanted = self.visible_tiles()
+        for tile in list(self.tile_items):
+            if tile not in wanted:
+                item, _ = self.tile_items.pop(tile)
+                self.canvas.delete(item)
+
+        missing = []
+        for tile in wanted:
+            if tile in self.tile_items:
+                continue
+            key = (self.render_key, tile)
+            if key in self.tile_cache:
+                self.tile_cache.move_to_end(key)
+                self.place_tile(tile, self.tile_cache[key])
+            else:
+                missing.append(tile)
+
+        if missing:
+            self.show_preview()
+            self.schedule_render()
+        else:
+            self.canvas.delete("preview")
+
+        self.canvas.tag_raise("cursor")
+
+    def place_tile(self, tile, image):
+        item = self.canvas.create_image(tile * TILE_WIDTH, 0, image=image, anchor="nw", tags="spectrogram")
+        # keep the image referenced while it is on screen, even if the LRU drops it
+        self.tile_items[tile] = (item, image)
+
+    def show_preview(self):
+        # coarse picture of the view from an already computed level, shown
+        # right away and covered by the real tiles as they come in
+        left = int(self.canvas.canvasx(0))
+        right = min(left + max(self.canvas.winfo_width(), 1), self.render_width)
+        if right <= left:
+            return
+        rgb = self.pipeline.preview_columns(left, right, self.render_width, self.render_height,
+                                           self.cmap_var.get(), self.frequency_axis(), PREVIEW_LEVELS)
+        if rgb is None:
+            return
+
+        self.preview_image = ImageTk.PhotoImage(Image.fromarray(rgb))
+        self.canvas.delete("preview")
+        self.canvas.create_image(left, 0, image=self.preview_image, anchor="nw", tags="preview")
+        self.canvas.tag_lower("preview")
+
+    def schedule_render(self):
+        # debounce, a slider drag only renders once it stops for a moment
+        if self.render_after_id is not None:
+            self.after_cancel(self.render_after_id)
+        self.render_after_id = self.after(RENDER_DEBOUNCE_MS, self.start_render)
+
+    def start_render(self):
+        self.render_after_id = None
+        if self.render_key is None:
+            return
+
+        # a newer request makes any older worker stop at its next tile
+        self.render_request += 1
+        tiles = [tile for tile in self.visible_tiles() if tile not in self.tile_items]
+        job = (self.render_key, self.render_width, self.render_height,
+               self.cmap_var.get(), self.frequency_axis())
+
+        thread = threading.Thread(target=self.run_render, args=(self.render_request, job, tiles))
+        thread.daemon = True
+        thread.start()
+
+    def run_render(self, request, job, tiles):
+        # background thread, numpy only, the PhotoImage is made on the UI thread
+        key, width, height, cmap_name, axis = job
+        for tile in tiles:
+            if request != self.render_request:
+                return # superseded
+
+            x0 = tile * TILE_WIDTH
+            x1 = min(x0 + TILE_WIDTH, width)
+            if self.pipeline.version != key[0]:
+                return # the spectrogram itself changed
+            try:
+                rgb = self.pipeline.render_columns(x0, x1, width, height, cmap_name, axis)
+            except Exception as e:
+                print(f"Render Error: {e}")
+                return
+
+            self.after(0, self.finish_tile, key, tile, rgb)
+
+    def finish_tile(self, key, tile, rgb):
+        # only results for what is on screen right now are used
+        if key != self.render_key:
+            return
+
+        image = ImageTk.PhotoImage(Image.fromarray(rgb))
+        self.tile_cache[(key, tile)] = image
+        while len(self.tile_cache) > TILE_CACHE_SIZE:
+            self.tile_cache.popitem(last=False)
+
+        if tile not in self.tile_items and tile in self.visible_tiles():
+            self.place_tile(tile, image)
+            self.canvas.tag_raise("cursor")
+
+        if all(t in self.tile_items for t in self.visible_tiles()):
+            self.canvas.delete("preview")
         
     def on_scroll(self, event):
-        if not self.tk_image: return
+        if self.render_key is None: return
         if event.num == 5 or (hasattr(event, 'delta') and event.delta < 0):
             self.canvas.xview_scroll(1, "units")
         elif event.num == 4 or (hasattr(event, 'delta') and event.delta > 0):
@@ -308,10 +539,10 @@ class AnalyzerTab(ctk.CTkFrame):
 
     def toggle_resolution(self):
         # Triggered when the High Res box is clicked
-        if self.analyzer.audio_data is None:
+        if not self.analyzer.has_audio():
             return
             
-        # recalculate spectrogram
+        # swap resolution (the HD matrix is only computed the first time)
         is_hd = self.high_res_var.get()
         self.current_hop = self.analyzer.recompute_spectrogram(high_res=is_hd)
         
@@ -320,7 +551,7 @@ class AnalyzerTab(ctk.CTkFrame):
 
     def save_spectrogram_image(self):
         # render the current view of the canvas to a file at HIGH RES
-        S_db, sr = self.analyzer.get_spectrogram_data()
+        S_db, sr = self.analyzer.S_db, self.analyzer.sr # raw storage, only checked for None here
         
         if S_db is None:
             return
@@ -336,7 +567,8 @@ class AnalyzerTab(ctk.CTkFrame):
         file_path = filedialog.asksaveasfilename(
             defaultextension=".png",
             initialfile=default_name,
-            filetypes=[("PNG Image", "*.png"), ("JPEG Image", "*.jpg")],
+            filetypes=[("PNG Image", "*.png"), ("TIFF Image", "*.tif"), ("JPEG Image", "*.jpg"),
+                       ("Deep Zoom Tiles", "*.dzi"), ("XYZ Tiles (folder)", "*.xyz")],
             title="Export High-Res Spectrogram"
         )
         
@@ -353,37 +585,59 @@ class AnalyzerTab(ctk.CTkFrame):
                 target_width = int((self.duration * self.pixels_per_second) * scale_factor)
                 
                 print(f"Exporting High Res: {target_width}x{target_height} (Scale: {scale_factor:.1f}x)")
+
+                if file_path.lower().endswith((".dzi", ".xyz")):
+                    self.export_tile_pyramid(file_path, S_db, sr, target_width, target_height)
+                else:
+                    self.export_strips(file_path, S_db, sr, target_width, target_height)
                 
-                #Log Scale / Normalization
-                data_to_plot = S_db
-                if self.log_scale_var.get():
-                    n_bins, n_frames = S_db.shape
-                    freqs_lin = np.linspace(0, sr/2, n_bins)
-                    freqs_log = np.geomspace(20, sr/2, n_bins)
-                    f = interp1d(freqs_lin, S_db, axis=0, kind='linear', fill_value="extrapolate")
-                    data_to_plot = f(freqs_log)
-                
-                min_db, max_db = -80.0, 0.0
-                norm_data = (data_to_plot - min_db) / (max_db - min_db)
-                norm_data = np.clip(norm_data, 0, 1)
-                norm_data = np.flipud(norm_data)
-                
-                # add Colormap
-                cmap = cm.get_cmap(self.cmap_var.get())
-                mapped_data = cmap(norm_data)
-                img_data = (mapped_data * 255).astype(np.uint8)
-                pil_image = Image.fromarray(img_data)
-                
-                # resize - LANCZOS for high quality down/up-scaling
-                export_img = pil_image.resize((target_width, target_height), Image.Resampling.LANCZOS)
-                export_img.save(file_path)
+            except Exception as e:
+                print(f"Error saving image: {e}")
+                import traceback
+                traceback.print_exc()
+
+    def export_strips(self, file_path, S_db, sr, width, height):
+        # Frequency axis / Normalization / Colormap / resize (LANCZOS for high quality
+        # down/up-scaling) strip by strip, PNG and TIFF are written to disk as the
+        # strips come in so hour long recordings dont need the whole image in memory.
+        # Same stages as the canvas but its own pipeline, loading another file
+        # meanwhile must not swap the source under the export. Off the UI thread,
+        # a long file takes minutes
+        cmap, axis = self.cmap_var.get(), self.frequency_axis()
+        pipeline = RenderPipeline()
+        pipeline.set_source(S_db, sr)
+
+        def run():
+            try:
+                StripExporter(pipeline, width, height, cmap, axis).save(file_path)
                 print(f"Saved image to {file_path}")
-                
             except Exception as e:
                 print(f"Error saving image: {e}")
                 import traceback
                 traceback.print_exc()
 
+        threading.Thread(target=run, daemon=True).start()
+
+    def export_tile_pyramid(self, file_path, S_db, sr, width, height):
+        # multi level 256x256 tiles for the browser viewer, on a process pool.
+        # runs off the UI thread since an hour long file means tens of thousands of tiles
+        if file_path.lower().endswith(".xyz"):
+            path, layout = file_path[:-4], "xyz"
+        else:
+            path, layout = file_path, "dzi"
+        cmap, axis = self.cmap_var.get(), self.frequency_axis()
+
+        def run():
+            try:
+                write_tile_pyramid(path, S_db, sr, width, height, cmap, axis, layout=layout)
+                print(f"Saved tiles to {path}")
+            except Exception as e:
+                print(f"Error saving tiles: {e}")
+                import traceback
+                traceback.print_exc()
+
+        threading.Thread(target=run, daemon=True).start()
+
     def run_audio(self):
         if self.current_file_path:
             self.player.play_file(self.current_file_path)
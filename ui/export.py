@@ -0,0 +1,380 @@
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+from audio.stft import resolve_workers
+from ui.render import RenderPipeline
+from config import EXPORT_STRIP_WIDTH, EXPORT_TILE_SIZE, EXPORT_PYRAMID_WORKERS, EXPORT_IN_MEMORY_MAX_MB
+
+# LANCZOS reads 3 source pixels on each side (scaled up when shrinking)
+LANCZOS_SUPPORT = 3
+
+
+class StripExporter:
+    """
+    Renders the export image in vertical strips of strip_width columns so
+    only one strip (and the frames under it) is in memory at a time,
+    whatever the output width. Each strip is LANCZOS resized from a source
+    crop that reaches past its edges by the filter support, so the strips
+    join up like a single full resize would. The crops come from the
+    pipeline's remap / normalize / colourise stages, the same ones the
+    canvas tiles go through.
+    """
+    def __init__(self, pipeline, width, height, cmap_name, axis="linear", strip_width=EXPORT_STRIP_WIDTH):
+        self.pipeline = pipeline
+        self.width = width
+        self.height = height
+        self.cmap_name = cmap_name
+        self.axis = axis
+        self.strip_width = strip_width
+
+    def render_strip(self, x0, x1):
+        # output columns x0..x1 as RGB of shape (height, x1 - x0, 3)
+        n_frames = self.pipeline.source.pyramid.base.shape[1]
+        scale = n_frames / self.width
+        support = LANCZOS_SUPPORT * max(1.0, scale) + 2
+
+        sx0, sx1 = x0 * scale, x1 * scale
+        lo = max(0, int(np.floor(sx0 - support)))
+        hi = min(n_frames, int(np.ceil(sx1 + support)))
+
+        crop = Image.fromarray(self.pipeline.export_frames(lo, hi, self.cmap_name, self.axis))
+        strip = crop.resize((x1 - x0, self.height), Image.Resampling.LANCZOS,
+                            box=(sx0 - lo, 0, sx1 - lo, crop.height))
+        return np.asarray(strip)
+
+    def strips(self):
+        # yields (x0, RGB strip) left to right
+        for x0 in range(0, self.width, self.strip_width):
+            x1 = min(x0 + self.strip_width, self.width)
+            yield x0, self.render_strip(x0, x1)
+
+    def save(self, file_path):
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext in (".tif", ".tiff"):
+            write_tiled_tiff(file_path, self.width, self.height, self.strips())
+        elif ext == ".png":
+            write_png(file_path, self.width, self.height, self.strips())
+        else:
+            # formats without a streaming writer (JPEG) get assembled in memory,
+            # only up to a size that is safe to hold
+            size_mb = self.width * self.height * 3 / (1 << 20)
+            if size_mb > EXPORT_IN_MEMORY_MAX_MB:
+                raise ValueError(f"{self.width}x{self.height} is too large for {ext or 'this format'} "
+                                 f"({size_mb:.0f} MB in memory), export as PNG or TIFF instead")
+            image = Image.new("RGB", (self.width, self.height))
+            for x0, strip in self.strips():
+                image.paste(Image.fromarray(strip), (x0, 0))
+            image.save(file_path)
+
+
+def write_png(file_path, width, height, strips):
+    """
+    PNG stores whole rows, so the strips are first put into a row major
+    scratch file (memory mapped, it lives on disk) and the rows are then
+    deflated one at a time into the IDAT chunks.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, scratch_path = tempfile.mkstemp(dir=directory, suffix=".raw")
+    os.close(fd)
+    try:
+        scratch = np.memmap(scratch_path, dtype=np.uint8, mode="w+", shape=(height, width, 3))
+        for x0, strip in strips:
+            scratch[:, x0:x0 + strip.shape[1]] = strip
+        scratch.flush()
+
+        with open(file_path, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+            _png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+            compressor = zlib.compressobj(6)
+            pending = []
+            pending_size = 0
+            for y in range(height):
+                # filter type 0 (none) in front of every row
+                data = compressor.compress(b"\x00" + scratch[y].tobytes())
+                if data:
+                    pending.append(data)
+                    pending_size += len(data)
+                if pending_size >= 1 << 20:
+                    _png_chunk(f, b"IDAT", b"".join(pending))
+                    pending, pending_size = [], 0
+            pending.append(compressor.flush())
+            _png_chunk(f, b"IDAT", b"".join(pending))
+            _png_chunk(f, b"IEND", b"")
+        del scratch
+    finally:
+        os.remove(scratch_path)
+
+
+def _png_chunk(f, kind, data):
+    f.write(struct.pack(">I", len(data)))
+    f.write(kind)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+
+def write_tiled_tiff(file_path, width, height, strips, tile=EXPORT_TILE_SIZE, big=None):
+    """
+    Deflate compressed RGB TIFF made of tile x tile blocks. Every strip is
+    cut into tiles and written right away, only the offset table is kept
+    until the end. Switches to BigTIFF when the file could pass 4GB (or
+    when big is True).
+    """
+    tiles_across = -(-width // tile)
+    tiles_down = -(-height // tile)
+    offsets = [0] * (tiles_across * tiles_down)
+    counts = [0] * (tiles_across * tiles_down)
+    if big is None:
+        big = width * height * 3 > 3 * (1 << 30)
+
+    # strips are split on tile boundaries, a partial tile column waits for the next strip
+    buffer = np.zeros((tiles_down * tile, 0, 3), dtype=np.uint8)
+    next_column = 0
+
+    with open(file_path, "wb") as f:
+        if big:
+            f.write(b"II" + struct.pack("<HHHQ", 43, 8, 0, 0))
+        else:
+            f.write(b"II" + struct.pack("<HI", 42, 0))
+
+        def flush_columns(buffer, next_column, final=False):
+            while buffer.shape[1] >= tile or (final and buffer.shape[1] > 0):
+                column = np.zeros((tiles_down * tile, tile, 3), dtype=np.uint8)
+                w = min(tile, buffer.shape[1])
+                column[:, :w] = buffer[:, :w]
+                buffer = buffer[:, w:]
+                for ty in range(tiles_down):
+                    data = zlib.compress(column[ty * tile:(ty + 1) * tile].tobytes(), 6)
+                    index = ty * tiles_across + next_column
+                    offsets[index] = f.tell()
+                    counts[index] = len(data)
+                    f.write(data)
+                next_column += 1
+            return buffer, next_column
+
+        for x0, strip in strips:
+            padded = np.zeros((tiles_down * tile, strip.shape[1], 3), dtype=np.uint8)
+            padded[:height] = strip
+            buffer = np.concatenate([buffer, padded], axis=1)
+            buffer, next_column = flush_columns(buffer, next_column)
+        buffer, next_column = flush_columns(buffer, next_column, final=True)
+
+        _write_tiff_ifd(f, big, width, height, tile, offsets, counts)
+
+
+def _write_tiff_ifd(f, big, width, height, tile, offsets, counts):
+    SHORT, LONG, LONG8 = 3, 4, 16
+    offset_type = LONG8 if big else LONG
+    offset_fmt = "Q" if big else "I"
+
+    def out_of_line(fmt, values):
+        # arrays that do not fit in the entry go before the IFD
+        if f.tell() % 2:
+            f.write(b"\x00")
+        position = f.tell()
+        f.write(struct.pack(f"<{len(values)}{fmt}", *values))
+        return position
+
+    inline = 8 if big else 4
+    bits_at = out_of_line("H", [8, 8, 8]) if 6 > inline else None
+    offsets_at = out_of_line(offset_fmt, offsets) if len(offsets) > 1 else None
+    counts_at = out_of_line(offset_fmt, counts) if len(counts) > 1 else None
+
+    entries = [
+        (256, LONG, 1, [width]),
+        (257, LONG, 1, [height]),
+        (258, SHORT, 3, [8, 8, 8] if bits_at is None else bits_at),
+        (259, SHORT, 1, [8]), # adobe deflate
+        (262, SHORT, 1, [2]), # RGB
+        (277, SHORT, 1, [3]),
+        (284, SHORT, 1, [1]), # chunky
+        (322, LONG, 1, [tile]),
+        (323, LONG, 1, [tile]),
+        (324, offset_type, len(offsets), offsets if offsets_at is None else offsets_at),
+        (325, offset_type, len(counts), counts if counts_at is None else counts_at),
+    ]
+
+    if f.tell() % 2:
+        f.write(b"\x00")
+    ifd_at = f.tell()
+    type_fmt = {SHORT: "H", LONG: "I", LONG8: "Q"}
+
+    if big:
+        f.write(struct.pack("<Q", len(entries)))
+    else:
+        f.write(struct.pack("<H", len(entries)))
+
+    for tag, kind, count, value in entries:
+        if isinstance(value, list):
+            field = struct.pack(f"<{len(value)}{type_fmt[kind]}", *value).ljust(inline, b"\x00")
+        else:
+            field = struct.pack("<" + ("Q" if big else "I"), value)
+        if big:
+            f.write(struct.pack("<HHQ", tag, kind, count) + field)
+        else:
+            f.write(struct.pack("<HHI", tag, kind, count) + field)
+
+    f.write(struct.pack("<Q" if big else "<I", 0)) # no next IFD
+
+    # point the header at the IFD
+    f.seek(8 if big else 4)
+    f.write(struct.pack("<Q" if big else "<I", ifd_at))
+
+
+# DEEP ZOOM / XYZ TILE PYRAMID
+# the pool workers open the spectrogram memory-mapped once and keep it here
+_worker = {}
+
+
+def _init_tile_worker(source_path, sr, width, height, cmap_name, axis):
+    pipeline = RenderPipeline()
+    pipeline.set_source(np.load(source_path, mmap_mode="r"), sr)
+    _worker["exporter"] = StripExporter(pipeline, width, height, cmap_name, axis)
+
+
+def _top_level_column(column, folder, tile, fmt):
+    # full resolution tiles of one column, rendered straight from the spectrogram
+    exporter = _worker["exporter"]
+    x0 = column * tile
+    strip = exporter.render_strip(x0, min(x0 + tile, exporter.width))
+    os.makedirs(folder, exist_ok=True)
+    for row, y0 in enumerate(range(0, exporter.height, tile)):
+        Image.fromarray(strip[y0:y0 + tile]).save(os.path.join(folder, f"{column}_{row}.{fmt}"))
+    return column
+
+
+def _reduced_column(column, rows, child_folder, folder, tile, fmt):
+    # every tile is the 2x2 child tiles below it halved. BOX on an exact 2x
+    # only averages pixel pairs, so neighbouring tiles never bleed into each other
+    os.makedirs(folder, exist_ok=True)
+    for row in range(rows):
+        children = {}
+        for dx in (0, 1):
+            for dy in (0, 1):
+                path = os.path.join(child_folder, f"{2 * column + dx}_{2 * row + dy}.{fmt}")
+                if os.path.exists(path):
+                    children[dx, dy] = Image.open(path)
+
+        w = children[0, 0].width + (children[1, 0].width if (1, 0) in children else 0)
+        h = children[0, 0].height + (children[0, 1].height if (0, 1) in children else 0)
+        merged = Image.new("RGB", (w, h))
+        for (dx, dy), child in children.items():
+            merged.paste(child, (dx * tile, dy * tile))
+        merged.resize((-(-w // 2), -(-h // 2)), Image.Resampling.BOX).save(
+            os.path.join(folder, f"{column}_{row}.{fmt}"))
+    return column
+
+
+def _source_file(S, directory):
+    # workers need the matrix as a .npy they can map. A cache hit already is one
+    if isinstance(S, np.memmap) and S.filename and S.flags.c_contiguous:
+        try:
+            if np.load(S.filename, mmap_mode="r").shape == S.shape:
+                return S.filename, False
+        except Exception:
+            pass
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".npy")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, np.ascontiguousarray(S))
+    return path, True
+
+
+def pyramid_levels(width, height):
+    # (width, height) of every Deep Zoom level, level 0 is 1x1
+    levels = [(width, height)]
+    while levels[-1] != (1, 1):
+        w, h = levels[-1]
+        levels.append((-(-w // 2), -(-h // 2)))
+    return levels[::-1]
+
+
+def write_tile_pyramid(path, S, sr, width, height, cmap_name, axis="linear", layout="dzi",
+                       tile=EXPORT_TILE_SIZE, fmt="png", workers=EXPORT_PYRAMID_WORKERS, progress=None):
+    """
+    Multi level tile pyramid of the width x height export for browser viewers.
+      layout="dzi"  path is the .dzi descriptor, tiles go to <name>_files/<level>/<col>_<row>.png
+      layout="xyz"  path is a folder, tiles go to <z>/<x>/<y>.png, z=0 is the first
+                    level that fits in a single tile
+    The full resolution level is rendered from S a tile column per job on a
+    process pool, every smaller level is then built from the tiles just written
+    (again a column per job). progress(done, total) counts tile columns.
+    """
+    if layout == "dzi":
+        root = os.path.splitext(path)[0] + "_files"
+    elif layout == "xyz":
+        root = path
+    else:
+        raise ValueError(f"Unknown tile layout: {layout}")
+    os.makedirs(root, exist_ok=True)
+
+    levels = pyramid_levels(width, height)
+    top = len(levels) - 1
+
+    def grid(level):
+        w, h = levels[level]
+        return -(-w // tile), -(-h // tile)
+
+    # the xyz tree is z/x/y.png, its tiles are written as level/x_y first and moved at the end
+    levels_root = os.path.join(root, ".levels") if layout == "xyz" else root
+
+    def folder(level):
+        return os.path.join(levels_root, str(level))
+
+    total = sum(grid(level)[0] for level in range(len(levels)))
+    done = 0
+
+    source_path, temporary = _source_file(S, root)
+    os.makedirs(levels_root, exist_ok=True)
+    try:
+        with ProcessPoolExecutor(max_workers=resolve_workers(workers), initializer=_init_tile_worker,
+                                 initargs=(source_path, sr, width, height, cmap_name, axis)) as pool:
+            for level in range(top, -1, -1):
+                columns, rows = grid(level)
+                if level == top:
+                    jobs = [pool.submit(_top_level_column, c, folder(level), tile, fmt)
+                            for c in range(columns)]
+                else:
+                    jobs = [pool.submit(_reduced_column, c, rows, folder(level + 1), folder(level), tile, fmt)
+                            for c in range(columns)]
+                # a level has to be on disk before the next one can read it
+                for job in as_completed(jobs):
+                    job.result()
+                    done += 1
+                    if progress is not None:
+                        progress(done, total)
+    finally:
+        if temporary:
+            os.remove(source_path)
+
+    if layout == "dzi":
+        with open(path, "w") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{fmt}" '
+                    f'Overlap="0" TileSize="{tile}">\n'
+                    f'  <Size Width="{width}" Height="{height}"/>\n'
+                    '</Image>\n')
+    else:
+        _to_xyz(root, levels_root, levels, tile, fmt)
+
+
+def _to_xyz(root, levels_root, levels, tile, fmt):
+    # move level/col_row.png to z/x/y.png, the levels below the single tile one are dropped
+    z0 = max(level for level, (w, h) in enumerate(levels) if w <= tile and h <= tile)
+
+    for level in range(len(levels)):
+        level_dir = os.path.join(levels_root, str(level))
+        if level >= z0:
+            for name in os.listdir(level_dir):
+                x, y = os.path.splitext(name)[0].split("_")
+                target = os.path.join(root, str(level - z0), x)
+                os.makedirs(target, exist_ok=True)
+                os.replace(os.path.join(level_dir, name), os.path.join(target, f"{y}.{fmt}"))
+        shutil.rmtree(level_dir)
+    os.rmdir(levels_root)
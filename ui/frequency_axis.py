@@ -0,0 +1,81 @@
+from functools import lru_cache
+
+import numpy as np
+import librosa
+from scipy import sparse
+
+# lowest frequency shown on the non linear axes
+F_MIN = 20.0
+# constant-Q style axis: bins per octave, starts at C1
+CQT_BINS_PER_OCTAVE = 48
+CQT_F_MIN = 32.70
+
+AXES = ("linear", "log", "mel", "cqt")
+
+
+def _interp_operator(freqs, sr, n_bins):
+    # two-tap linear interpolation at the wanted frequencies, clamped at the
+    # ends (no extrapolation), one sparse row per output bin
+    pos = np.clip(freqs / (sr / 2) * (n_bins - 1), 0, n_bins - 1)
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.minimum(lo + 1, n_bins - 1)
+    w = (pos - lo).astype(np.float32)
+
+    rows = np.arange(len(freqs))
+    data = np.concatenate([1 - w, w])
+    op = sparse.csr_matrix((data, (np.concatenate([rows, rows]), np.concatenate([lo, hi]))),
+                           shape=(len(freqs), n_bins), dtype=np.float32)
+    op.sum_duplicates()
+    return op
+
+
+def _band_operator(edges, sr, n_bins):
+    # average of the linear bins inside each band, bands narrower than one
+    # bin fall back to interpolation at the band centre
+    bin_hz = (sr / 2) / (n_bins - 1)
+    centres = np.sqrt(edges[:-1] * edges[1:])
+    op = _interp_operator(centres, sr, n_bins).tolil()
+
+    for k in range(len(centres)):
+        first = int(np.ceil(edges[k] / bin_hz))
+        last = min(int(np.floor(edges[k + 1] / bin_hz)), n_bins - 1)
+        if last - first >= 1:
+            op.rows[k] = list(range(first, last + 1))
+            op.data[k] = [1.0 / (last - first + 1)] * (last - first + 1)
+
+    return op.tocsr()
+
+
+@lru_cache(maxsize=16)
+def frequency_operator(axis, sr, n_bins, n_out=None):
+    """
+    Sparse (n_out, n_bins) matrix that maps linear STFT bins onto the
+    wanted frequency axis. It only depends on the axis and sizes, so it is
+    built once per key and every redraw is a single sparse matmul.
+    Returns None for the linear axis.
+    """
+    n_out = n_out or n_bins
+    nyquist = sr / 2
+
+    if axis == "linear":
+        return None
+    if axis == "log":
+        return _interp_operator(np.geomspace(F_MIN, nyquist, n_out), sr, n_bins)
+    if axis == "mel":
+        return _interp_operator(librosa.mel_frequencies(n_out, fmin=F_MIN, fmax=nyquist), sr, n_bins)
+    if axis == "cqt":
+        # fixed bins per octave, the output height follows from the range
+        n_octaves = np.log2(nyquist / CQT_F_MIN)
+        n_cq = int(n_octaves * CQT_BINS_PER_OCTAVE)
+        edges = CQT_F_MIN * 2.0 ** ((np.arange(n_cq + 1) - 0.5) / CQT_BINS_PER_OCTAVE)
+        edges = np.minimum(edges, nyquist)
+        return _band_operator(edges, sr, n_bins)
+    raise ValueError(f"Unknown frequency axis: {axis}")
+
+
+def remap(S_db, sr, axis, n_out=None):
+    # apply the cached operator, float32 in and out
+    op = frequency_operator(axis, sr, S_db.shape[0], n_out)
+    if op is None:
+        return S_db
+    return np.asarray(op @ np.asarray(S_db, dtype=np.float32), dtype=np.float32)
@@ -45,4 +45,5 @@ class SpectralStudio(ctk.CTk):
 
     def on_closing(self):
         # clean up threads or audio streams if needed later
+        self.painter.stop_live()
         self.destroy()
\ No newline at end of file
@@ -6,9 +6,18 @@ import threading
 import os
 
 # backend logic
-from audio.generator import AudioGenerator
+from audio.generator import AudioGenerator, settings_from_filename
 from audio.player import AudioPlayer
-from config import COLOR_BG, COLOR_ACCENT, OUTPUT_FILENAME, CANVAS_SIZE, EXPORT_DIMENSIONS
+from audio.live import LiveEngine
+from config import (COLOR_BG, COLOR_ACCENT, CANVAS_SIZE, EXPORT_DIMENSIONS, PREVIEW_DELAY_MS,
+                    LIVE_PLAYHEAD_MS, PAINT_FRAME_MS)
+
+
+def display_lut():
+    # grey level -> screen colour, black is the canvas background and white the brush colour
+    bg = [int(COLOR_BG[i:i + 2], 16) for i in (1, 3, 5)]
+    fg = [int(COLOR_ACCENT[i:i + 2], 16) for i in (1, 3, 5)]
+    return [round(b + (f - b) * v / 255) for b, f in zip(bg, fg) for v in range(256)]
 
 class PainterTab(ctk.CTkFrame):
     def __init__(self, master, **kwargs):
@@ -24,7 +33,26 @@ class PainterTab(ctk.CTkFrame):
         self.canvas_width = CANVAS_SIZE
         self.canvas_height = CANVAS_SIZE
         self.generated_file_path = None
+        self.scale_factor = 1.0
 
+        # strokes only go into self.image, the canvas shows one bitmap of it
+        # and only the area painted since the last frame is copied over
+        self.tk_image_ref = None
+        self.dirty_rect = None
+        self.flush_after_id = None
+        self.lut = display_lut()
+        # image columns painted since the last generate, None = unknown (new image)
+        self.dirty_columns = None
+
+        # live preview after every stroke, only the newest request gets played
+        self.preview_var = ctk.BooleanVar(value=False)
+        self.preview_after_id = None
+        self.preview_request = 0
+
+        # live mode, a playhead sweeps the canvas and plays it as it goes
+        self.live_var = ctk.BooleanVar(value=False)
+        self.live_engine = None
+        self.live_after_id = None
 
         # This is what gets sent to the audio generator
         self.image = Image.new("L", (self.canvas_width, self.canvas_height), "black")
@@ -49,6 +77,7 @@ class PainterTab(ctk.CTkFrame):
         self.draw_canvas = tk.Canvas(left_frame, width=self.canvas_width, height=self.canvas_height, 
                                 bg=COLOR_BG, cursor="crosshair", highlightthickness=0)
         self.draw_canvas.pack(pady=10)
+        self.show_image()
 
         # Bind mouse events
         self.draw_canvas.bind("<Button-1>", self.start_paint)
@@ -128,6 +157,16 @@ class PainterTab(ctk.CTkFrame):
                                       fg_color="green", command=self.play_audio)
         self.btn_play.pack(pady=5, padx=20, fill="x")
 
+        # Quick low quality sound after every stroke, played from memory
+        self.chk_preview = ctk.CTkCheckBox(right_frame, text="Live Preview", variable=self.preview_var,
+                                           command=self.schedule_preview)
+        self.chk_preview.pack(pady=5, padx=20)
+
+        # Loops over the canvas and plays the columns under the playhead, strokes are heard right away
+        self.chk_live = ctk.CTkCheckBox(right_frame, text="Live Playhead", variable=self.live_var,
+                                        command=self.toggle_live)
+        self.chk_live.pack(pady=5, padx=20)
+
         self.status_label = ctk.CTkLabel(right_frame, text="Ready to draw.")
         self.status_label.pack(side="bottom", pady=20)
 
@@ -141,16 +180,10 @@ class PainterTab(ctk.CTkFrame):
         x, y = event.x, event.y
         
         if self.last_x:
-            # Draw on visible screen
-            self.draw_canvas.create_line(self.last_x, self.last_y, x, y, 
-                                         width=brush_size * 2, fill=COLOR_ACCENT,
-                                         capstyle=tk.ROUND, smooth=True)
-            
             # Draw on internal PIL image scaled
             # If scale_factor is 0.5 (shown half size), we must multiply coords by 2 (divide by 0.5)
             # to draw on the big image.
-            
-            sf = getattr(self, 'scale_factor', 1.0)
+            sf = self.scale_factor
             
             real_lx = self.last_x / sf
             real_ly = self.last_y / sf
@@ -160,6 +193,22 @@ class PainterTab(ctk.CTkFrame):
             
             self.draw.line([real_lx, real_ly, real_x, real_y], 
                            fill=255, width=int(real_width), joint="curve")
+            # round end so the segments join up without notches
+            r = real_width / 2
+            self.draw.ellipse([real_x - r, real_y - r, real_x + r, real_y + r], fill=255)
+
+            # remember which columns the stroke touched, the generator only redoes those
+            if self.dirty_columns is not None:
+                half = int(real_width) // 2 + 1
+                x0 = max(0, int(min(real_lx, real_x)) - half)
+                x1 = min(self.image.width, int(max(real_lx, real_x)) + half + 1)
+                self.dirty_columns.update(range(x0, x1))
+
+            # screen area to refresh, drawn on the next frame together with
+            # whatever else gets painted until then
+            pad = brush_size + 2
+            self.mark_dirty(min(self.last_x, x) - pad, min(self.last_y, y) - pad,
+                            max(self.last_x, x) + pad, max(self.last_y, y) + pad)
 
         self.last_x = x
         self.last_y = y
@@ -167,6 +216,55 @@ class PainterTab(ctk.CTkFrame):
     def stop_paint(self, event):
         self.last_x = None
         self.last_y = None
+        self.schedule_preview()
+
+    def mark_dirty(self, x0, y0, x1, y1):
+        if self.dirty_rect is not None:
+            dx0, dy0, dx1, dy1 = self.dirty_rect
+            x0, y0, x1, y1 = min(x0, dx0), min(y0, dy0), max(x1, dx1), max(y1, dy1)
+        self.dirty_rect = (x0, y0, x1, y1)
+        if self.flush_after_id is None:
+            self.flush_after_id = self.after(PAINT_FRAME_MS, self.flush_canvas)
+
+    def display_region(self, box):
+        # part of self.image as it looks on screen, box in canvas pixels
+        x0, y0, x1, y1 = box
+        sf = self.scale_factor
+        if sf == 1.0:
+            region = self.image.crop(box)
+        else:
+            region = self.image.resize((x1 - x0, y1 - y0), Image.Resampling.BOX,
+                                       box=(x0 / sf, y0 / sf, x1 / sf, y1 / sf))
+        return region.convert("RGB").point(self.lut)
+
+    def show_image(self):
+        # whole canvas redrawn from self.image, for new, loaded or cleared images
+        self.cancel_flush()
+        self.tk_image_ref = ImageTk.PhotoImage(self.display_region((0, 0, self.canvas_width, self.canvas_height)))
+        self.draw_canvas.delete("bitmap")
+        self.draw_canvas.create_image(0, 0, image=self.tk_image_ref, anchor="nw", tags="bitmap")
+        self.draw_canvas.tag_lower("bitmap")
+
+    def flush_canvas(self):
+        # copy the dirty rectangle into the displayed bitmap, the rest of it stays as is
+        self.flush_after_id = None
+        if self.dirty_rect is None:
+            return
+        x0, y0, x1, y1 = (int(v) for v in self.dirty_rect)
+        self.dirty_rect = None
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.canvas_width, x1), min(self.canvas_height, y1)
+        if x1 <= x0 or y1 <= y0:
+            return
+
+        patch = ImageTk.PhotoImage(self.display_region((x0, y0, x1, y1)))
+        self.draw_canvas.tk.call(str(self.tk_image_ref), "copy", str(patch), "-to", x0, y0)
+
+    def cancel_flush(self):
+        if self.flush_after_id is not None:
+            self.after_cancel(self.flush_after_id)
+            self.flush_after_id = None
+        self.dirty_rect = None
 
 
     def load_image(self):
@@ -179,18 +277,18 @@ class PainterTab(ctk.CTkFrame):
                 # KEEP FULL RESOLUTION loaded_img
                 self.image = Image.open(file_path).convert('L')
                 self.draw = ImageDraw.Draw(self.image)
+                self.dirty_columns = None
                 
                 # Display Image (Scaled to fit UI)
-                display_img = self.image.copy()
+                w, h = self.image.size
                 self.scale_factor = 1.0
                 
                 max_limit = 1000
-                if display_img.width > max_limit or display_img.height > max_limit:
-                    display_img.thumbnail((max_limit, max_limit), Image.Resampling.LANCZOS)
+                if w > max_limit or h > max_limit:
                     # Calculate scale factor (Display / Original)
-                    self.scale_factor = display_img.width / float(self.image.width)
-
-                w, h = display_img.size
+                    self.scale_factor = min(max_limit / w, max_limit / h)
+                    w = max(1, round(w * self.scale_factor))
+                    h = max(1, round(h * self.scale_factor))
 
                 # match canvas to Display size
                 self.canvas_width = w
@@ -204,20 +302,17 @@ class PainterTab(ctk.CTkFrame):
                 self.draw_canvas.configure(width=w, height=h)
                 
                 # display on screen
-                self.tk_image_ref = ImageTk.PhotoImage(display_img)
-                self.draw_canvas.create_image(0, 0, image=self.tk_image_ref, anchor="nw")
+                self.show_image()
                 self.status_label.configure(text=f"Loaded: {self.image.width}x{self.image.height} (Shown: {w}x{h})")
                 
-                import re
-                sr_match = re.search(r'_(\d+)Hz', file_path)
-                if sr_match:
-                    sr_value = sr_match.group(1)
+                settings = settings_from_filename(file_path)
+                if "sample_rate" in settings:
+                    sr_value = str(settings["sample_rate"])
                     self.entry_samplerate.delete(0, "end")
                     self.entry_samplerate.insert(0, sr_value)
                 
-                dur_match = re.search(r'_([\d.]+)s', file_path)
-                if dur_match:
-                    dur_value = dur_match.group(1)
+                if "duration" in settings:
+                    dur_value = f"{settings['duration']:g}"
                     self.entry_duration.delete(0, "end")
                     self.entry_duration.insert(0, dur_value)
                     dur_float = float(dur_value)
@@ -226,11 +321,10 @@ class PainterTab(ctk.CTkFrame):
                     self.lbl_duration.configure(text=f"Duration: {dur_value}s")
 
     def clear_canvas(self):
-        self.draw_canvas.delete("all")
-
         # reset to default size
         self.canvas_width = CANVAS_SIZE
         self.canvas_height = CANVAS_SIZE
+        self.scale_factor = 1.0
         
         # reset shared mem
         EXPORT_DIMENSIONS['w'] = CANVAS_SIZE
@@ -241,7 +335,8 @@ class PainterTab(ctk.CTkFrame):
         self.draw_canvas.configure(width=self.canvas_width, height=self.canvas_height)
         self.image = Image.new("L", (self.canvas_width, self.canvas_height), "black")
         self.draw = ImageDraw.Draw(self.image)
-        self.tk_image_ref = None
+        self.dirty_columns = None
+        self.show_image()
         self.btn_play.configure(state="disabled")
         self.status_label.configure(text="Canvas cleared")
 
@@ -291,6 +386,19 @@ class PainterTab(ctk.CTkFrame):
         self.btn_convert.configure(state="disabled", text="Computing...")
         self.status_label.configure(text="Generating audio...")
         
+        duration, sample_rate, iterations, pitch_shift = self.read_settings()
+
+        # strokes from here on belong to the next render. The image is copied
+        # at the same moment, a stroke made while the worker runs would
+        # otherwise end up in the audio (and in the cache under the old key)
+        dirty_columns, self.dirty_columns = self.dirty_columns, set()
+        image = self.image.copy()
+        
+        thread = threading.Thread(target=self.run_generation,
+                                  args=(image, duration, iterations, file_path, pitch_shift, sample_rate, dirty_columns))
+        thread.start()
+
+    def read_settings(self):
         # Read duration from entry field (allows values beyond slider range)
         try:
             duration = float(self.entry_duration.get())
@@ -304,14 +412,89 @@ class PainterTab(ctk.CTkFrame):
         
         iterations = int(self.slider_quality.get())
         pitch_shift = self.slider_pitch.get()
-        
-        thread = threading.Thread(target=self.run_generation, args=(duration, iterations, file_path, pitch_shift, sample_rate))
+        return duration, sample_rate, iterations, pitch_shift
+
+    def schedule_preview(self):
+        # wait a moment after the stroke so a quick scribble only previews once
+        if self.preview_after_id is not None:
+            self.after_cancel(self.preview_after_id)
+            self.preview_after_id = None
+        if self.preview_var.get():
+            self.preview_after_id = self.after(PREVIEW_DELAY_MS, self.start_preview)
+
+    def start_preview(self):
+        self.preview_after_id = None
+        self.preview_request += 1
+        duration, sample_rate, _, pitch_shift = self.read_settings()
+
+        # a copy, the next stroke should not change the image under the worker
+        image = self.image.copy()
+        thread = threading.Thread(target=self.run_preview,
+                                  args=(self.preview_request, image, duration, pitch_shift, sample_rate),
+                                  daemon=True)
         thread.start()
 
-    def run_generation(self, duration, iterations, output_path, pitch_shift, sample_rate):
-        # Call the backend generator
-        # We pass self.image, which is the Pillow object we drew on
-        filename, _ = self.generator.generate_from_image(self.image, duration, iterations, output_path, pitch_shift, sample_rate)
+    def run_preview(self, request, image, duration, pitch_shift, sample_rate):
+        audio, preview_rate = self.generator.generate_preview(image, duration, pitch_shift, sample_rate)
+        if audio is not None and request == self.preview_request:
+            self.after(0, self.play_preview, request, audio, preview_rate)
+
+    def play_preview(self, request, audio, preview_rate):
+        # a newer stroke may have started its own preview meanwhile
+        if request == self.preview_request and self.preview_var.get():
+            self.player.play_preview(audio, preview_rate)
+
+    def toggle_live(self):
+        if not self.live_var.get():
+            self.stop_live()
+            return
+
+        # duration, sample rate and pitch are read once, toggle again to pick up new settings
+        self.player.stop_file()
+        duration, sample_rate, _, pitch_shift = self.read_settings()
+        # the engine asks for the image every block, so loads and clears are followed too
+        self.live_engine = LiveEngine(lambda: self.image, duration, sample_rate, pitch_shift)
+        try:
+            self.live_engine.start()
+        except Exception as e:
+            print(f"Live playback failed: {e}")
+            self.live_engine.stop()
+            self.live_engine = None
+            self.live_var.set(False)
+            self.status_label.configure(text="No audio output for live mode.")
+            return
+        self.update_live()
+
+    def update_live(self):
+        # playhead line and the engine's counters, on the Tk thread
+        engine = self.live_engine
+        if engine is None:
+            return
+        x = engine.playhead() * self.canvas_width
+        if self.draw_canvas.find_withtag("playhead"):
+            self.draw_canvas.coords("playhead", x, 0, x, self.canvas_height)
+        else:
+            self.draw_canvas.create_line(x, 0, x, self.canvas_height, fill="white", tags="playhead")
+
+        stats = engine.stats
+        self.status_label.configure(text=f"Live: {stats['underruns']} underruns, {stats['late']} late blocks "
+                                         f"({stats['synth_ms']:.1f}/{stats['budget_ms']:.0f} ms)")
+        self.live_after_id = self.after(LIVE_PLAYHEAD_MS, self.update_live)
+
+    def stop_live(self):
+        if self.live_after_id is not None:
+            self.after_cancel(self.live_after_id)
+            self.live_after_id = None
+        if self.live_engine is not None:
+            self.live_engine.stop()
+            self.live_engine = None
+        self.draw_canvas.delete("playhead")
+        self.live_var.set(False)
+
+    def run_generation(self, image, duration, iterations, output_path, pitch_shift, sample_rate, dirty_columns=None):
+        # Call the backend generator on the snapshot of what we drew
+        filename, _ = self.generator.generate_from_image(image, duration, iterations, output_path, pitch_shift, sample_rate,
+                                                         dirty_columns=dirty_columns)
         
         self.after(0, self.finish_generation, filename)
 
@@ -323,6 +506,8 @@ class PainterTab(ctk.CTkFrame):
             self.status_label.configure(text=f"Saved to: {os.path.basename(filename)}")
             self.btn_play.configure(state="normal")
         else:
+            # the failed render left no phase to build on, diff against the last good one next time
+            self.dirty_columns = None
             self.status_label.configure(text="Error generating audio.")
 
     def play_audio(self):
@@ -0,0 +1,259 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import matplotlib
+
+from audio.compact import as_db, as_levels
+from ui import frequency_axis
+from config import PYRAMID_POOLING, RENDER_STAGE_CACHE, RENDER_CHUNK_FRAMES
+
+
+def pool_frames(S, pooling=PYRAMID_POOLING):
+    # halve the time axis, an odd last frame is carried over as is
+    even = S.shape[1] - S.shape[1] % 2
+    a, b = S[:, 0:even:2], S[:, 1:even:2]
+
+    if pooling == "max":
+        pooled = np.maximum(a, b)
+    elif pooling == "mean":
+        if S.dtype == np.uint8:
+            pooled = ((a.astype(np.uint16) + b + 1) // 2).astype(np.uint8)
+        else:
+            pooled = (a + b) / 2
+            pooled = pooled.astype(S.dtype, copy=False)
+    else:
+        raise ValueError(f"Unknown pooling: {pooling}")
+
+    if even < S.shape[1]:
+        pooled = np.concatenate([pooled, S[:, -1:]], axis=1)
+    return pooled
+
+
+class SpectrogramPyramid:
+    """
+    Mipmap style copies of a spectrogram, level k has 2**k times fewer frames.
+    A level is pooled from the one below the first time it is asked for,
+    all of them together cost about as much as the base matrix.
+    """
+    def __init__(self, S, pooling=PYRAMID_POOLING, min_frames=64):
+        self.base = S
+        self.pooling = pooling
+        self.min_frames = min_frames
+        self.levels = [S]
+        self.lock = threading.Lock() # two renders should not pool the same level
+
+    def level(self, k):
+        if k < len(self.levels):
+            return self.levels[k]
+        with self.lock:
+            while len(self.levels) <= k:
+                self.levels.append(pool_frames(self.levels[-1], self.pooling))
+        return self.levels[k]
+
+    def pick_level(self, total_width):
+        # deepest level that still has at least one frame per output column
+        n_frames = self.base.shape[1]
+        k = 0
+        while (n_frames >> (k + 1)) >= max(total_width, self.min_frames):
+            k += 1
+        return k
+
+    def pick(self, total_width):
+        k = self.pick_level(total_width)
+        return k, self.level(k)
+
+
+def column_index(x0, x1, total_width, n_frames):
+    # source frame shown by every output column in x0..x1 (same pick as a NEAREST resize)
+    x = np.arange(x0, x1)
+    idx = ((x + 0.5) * n_frames / total_width).astype(np.intp)
+    return np.minimum(idx, n_frames - 1)
+
+
+def row_index(height, n_bins):
+    # source bin for every output row, flipped so low frequencies are at the bottom
+    idx = column_index(0, height, height, n_bins)
+    return n_bins - 1 - idx
+
+
+@lru_cache(maxsize=16)
+def colormap_lut(cmap_name):
+    # 256 x 3 uint8 RGB table, entry i is the colour of level bin i
+    cmap = matplotlib.colormaps[cmap_name]
+    centres = (np.arange(256) + 0.5) / 256
+    lut = cmap(centres, bytes=True)[:, :3].copy()
+    lut.setflags(write=False)
+    return lut
+
+
+def apply_lut(levels, lut, out=None):
+    # levels (uint8) -> RGB written straight into out, no float or alpha temporaries
+    if out is None:
+        out = np.empty(levels.shape + (3,), dtype=np.uint8)
+    np.take(lut, levels, axis=0, out=out)
+    return out
+
+
+def remap_frequency(S, sr, axis):
+    # stage 1, linear storage is passed through untouched
+    if axis == "linear":
+        return S
+    return frequency_axis.remap(as_db(S), sr, axis)
+
+
+def render_partial_columns(S, sr, n_frames, x0, x1, width, height, cmap_name, axis="linear", first_frame=0):
+    """
+    Columns x0..x1 of a spectrogram that is still being computed. S holds
+    frames first_frame.. of the n_frames, columns just outside of them
+    repeat the nearest frame S has. Nothing is cached, only the shown
+    pixels are touched.
+    """
+    cols = np.clip(column_index(x0, x1, width, n_frames) - first_frame, 0, S.shape[1] - 1)
+    block = remap_frequency(S[:, cols], sr, axis)
+    rows = row_index(height, block.shape[0])
+    return apply_lut(as_levels(block[rows]), colormap_lut(cmap_name))
+
+
+class RenderSource:
+    # one spectrogram and the stage caches that belong to it
+    def __init__(self, S, sr, pooling, version):
+        self.pyramid = SpectrogramPyramid(S, pooling)
+        self.sr = sr
+        self.version = version
+        self.stages = {name: OrderedDict() for name in RenderPipeline.STAGES}
+
+
+class RenderPipeline:
+    """
+    Spectrogram -> image in four stages:
+        remap      frequency axis (linear / log / mel / cqt)
+        normalize  dB -> 0..255 levels
+        colourise  levels -> RGB through a 256 entry colormap table
+        resample   to the output size
+    remap, normalize and colourise run on fixed chunks of chunk_frames
+    frames of a pyramid level, never on a whole level, so a tile costs the
+    same however long the file is. The chunks do not depend on the output
+    width, so every stage keeps them in a small LRU keyed only by its own
+    inputs: a new colormap starts at colourise, a new zoom that stays on the
+    same pyramid level only redoes resample. The canvas tiles and the image
+    export both render through here.
+    Exports read their strips through export_frames, the same stages
+    without filling the caches.
+    Renders run on worker threads. The spectrogram and its caches are one
+    RenderSource that set_source swaps out in one go, a render keeps using
+    the source it started with and checks `version` to see if it is stale.
+    The lock is only held to look up or store a cache entry, never while
+    computing, so the UI thread never waits for a render.
+    """
+    STAGES = ("remap", "normalize", "colourise", "resample")
+
+    def __init__(self, pooling=PYRAMID_POOLING, cache_size=RENDER_STAGE_CACHE, chunk_frames=RENDER_CHUNK_FRAMES):
+        self.pooling = pooling
+        self.cache_size = cache_size
+        self.chunk_frames = chunk_frames
+        self.source = None
+        self.lock = threading.Lock()
+        self.version = 0 # bumped every time the source matrix changes
+
+    def set_source(self, S, sr):
+        # a different matrix gets a new source with empty caches
+        source = self.source
+        if source is not None and source.pyramid.base is S and source.sr == sr:
+            return
+        self.version += 1
+        self.source = RenderSource(S, sr, self.pooling, self.version)
+
+    def clear(self):
+        source = self.source
+        if source is not None:
+            with self.lock:
+                for cache in source.stages.values():
+                    cache.clear()
+
+    def _cached(self, source, stage, key, compute, cache=True):
+        if not cache:
+            return compute()
+        cache = source.stages[stage]
+        with self.lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+
+        value = compute()
+        with self.lock:
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return value
+
+    # lo..hi is one chunk when cached (render_columns), any range when not (export_frames)
+    def remap(self, source, level, axis, lo, hi, cache=True):
+        # every frame is remapped on its own, so a slice gives the same columns as the whole level
+        return self._cached(source, "remap", (level, axis, lo, hi),
+                            lambda: remap_frequency(source.pyramid.level(level)[:, lo:hi], source.sr, axis), cache)
+
+    def normalize(self, source, level, axis, lo, hi, cache=True):
+        # same 256 bins as the uint8 storage, so that case is free
+        return self._cached(source, "normalize", (level, axis, lo, hi),
+                            lambda: as_levels(self.remap(source, level, axis, lo, hi, cache)), cache)
+
+    def colourise(self, source, level, axis, cmap_name, lo, hi, cache=True):
+        return self._cached(source, "colourise", (level, axis, cmap_name, lo, hi),
+                            lambda: apply_lut(self.normalize(source, level, axis, lo, hi, cache),
+                                              colormap_lut(cmap_name)), cache)
+
+    def render_columns(self, x0, x1, width, height, cmap_name, axis="linear"):
+        """
+        Output columns x0..x1 of an image width x height, read from the
+        pyramid level that fits the zoom. Tiles rendered this way line up
+        exactly with a NEAREST resize of the whole image.
+        """
+        source = self.source
+        level, S = source.pyramid.pick(width)
+        n_frames, chunk = S.shape[1], self.chunk_frames
+
+        def compute():
+            cols = column_index(x0, x1, width, n_frames)
+            rows = None
+            out = None
+            # the columns can span a chunk edge, each chunk fills its own columns
+            for c in range(int(cols[0]) // chunk, int(cols[-1]) // chunk + 1):
+                lo, hi = c * chunk, min((c + 1) * chunk, n_frames)
+                rgb = self.colourise(source, level, axis, cmap_name, lo, hi)
+                if out is None:
+                    rows = row_index(height, rgb.shape[0])
+                    out = np.empty((height, len(cols), 3), dtype=np.uint8)
+                inside = (cols >= lo) & (cols < hi)
+                out[:, inside] = rgb[rows[:, None], cols[inside] - lo]
+            return out
+
+        return self._cached(source, "resample", (level, axis, cmap_name, x0, x1, width, height), compute)
+
+    def preview_columns(self, x0, x1, width, height, cmap_name, axis="linear", coarse=2):
+        """
+        Quick look at columns x0..x1 from a pyramid level that is already
+        pooled (ideally `coarse` levels below the one render_columns would
+        use). Only the frames under the output columns are remapped and
+        coloured, so the cost only depends on the output size.
+        Returns None when there is no spectrogram.
+        """
+        source = self.source
+        if source is None:
+            return None
+
+        # no pooling here, this runs on the UI thread
+        target = source.pyramid.pick_level(width) + coarse
+        levels = source.pyramid.levels
+        S = levels[min(target, len(levels) - 1)]
+        return render_partial_columns(S, source.sr, S.shape[1], x0, x1, width, height, cmap_name, axis)
+
+    def export_frames(self, lo, hi, cmap_name, axis="linear"):
+        # frames lo..hi of the full resolution matrix through remap, normalize
+        # and colourise, flipped so low frequencies are at the bottom. Not
+        # cached, an export reads every frame once and would only push the
+        # canvas tiles out
+        source = self.source
+        rgb = self.colourise(source, 0, axis, cmap_name, lo, hi, cache=False)
+        return np.flipud(rgb)